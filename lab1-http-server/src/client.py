@@ -3,6 +3,62 @@ import sys
 import os
 from urllib.parse import urlsplit
 
+RECV_CHUNK = 1 << 16
+
+# Header names are compared as lowercase bytes, no decode needed
+_CONTENT_TYPE = b"content-type"
+_CONTENT_DISPOSITION = b"content-disposition"
+_CONTENT_LENGTH = b"content-length"
+
+
+def _recv_all(s: socket.socket, buf: bytearray | None = None) -> bytearray:
+    # Receive into one growing buffer instead of joining a list of chunks
+    buf = bytearray() if buf is None else buf
+    off = len(buf)
+    buf.extend(bytes(RECV_CHUNK))
+    view = memoryview(buf)
+    while True:
+        if off == len(buf):
+            view.release()  # a bytearray cannot be resized while a view is exported
+            buf.extend(bytes(len(buf)))
+            view = memoryview(buf)
+        n = s.recv_into(view[off:])
+        if not n:
+            break
+        off += n
+    view.release()
+    del buf[off:]
+    return buf
+
+
+def _read_headers(s: socket.socket) -> tuple[bytes | None, bytearray]:
+    """Read until the end of the header block; returns (headers, leftover body bytes)."""
+    buf = bytearray()
+    chunk = memoryview(bytearray(RECV_CHUNK))
+    while True:
+        start = max(0, len(buf) - 3)
+        n = s.recv_into(chunk)
+        if not n:
+            return None, buf
+        buf += chunk[:n]
+        header_end = buf.find(b"\r\n\r\n", start)
+        if header_end != -1:
+            return bytes(buf[:header_end]), buf[header_end + 4 :]
+
+
+def _stream_body(s: socket.socket, f, leftover: bytearray, length: int | None) -> int:
+    """Write leftover then the rest of the body to f in RECV_CHUNK pieces; returns bytes written."""
+    f.write(leftover)
+    written = len(leftover)
+    chunk = memoryview(bytearray(RECV_CHUNK))
+    while length is None or written < length:
+        n = s.recv_into(chunk)
+        if not n:
+            break
+        f.write(chunk[:n])
+        written += n
+    return written
+
 
 def http_client_request(host: str, port: int, filename: str, out_target: str | None = None):
     if not filename.startswith('/'):
@@ -20,14 +76,7 @@ def http_client_request(host: str, port: int, filename: str, out_target: str | N
             f"\r\n"
         )
         s.sendall(req.encode("utf-8"))
-        chunks = []
-        while True:
-            data = s.recv(4096)
-            if not data:
-                break
-            chunks.append(data)
-    raw = b"".join(chunks)
-    _handle_response(raw, out_target)
+        _handle_response(s, out_target)
 
 
 def http_client_url(url: str):
@@ -52,69 +101,74 @@ def http_client_url(url: str):
             f"\r\n"
         )
         s.sendall(req.encode("utf-8"))
+        _handle_response(s)
+
+
+def _parse_headers(header_bytes: bytes) -> tuple[bytes, dict[bytes, bytes]]:
+    lines = header_bytes.split(b"\r\n")
+    header_pairs = {}
+    for line in lines[1:]:
+        k, sep, v = line.partition(b":")
+        if sep:
+            header_pairs[k.strip().lower()] = v.strip()
+    return lines[0], header_pairs
 
-        # Read all bytes
-        chunks = []
-        while True:
-            data = s.recv(4096)
-            if not data:
-                break
-            chunks.append(data)
-        raw = b"".join(chunks)
 
-    _handle_response(raw)
+def _content_length(header_pairs: dict[bytes, bytes]) -> int | None:
+    try:
+        return int(header_pairs[_CONTENT_LENGTH])
+    except (KeyError, ValueError):
+        return None
 
 
-def _handle_response(raw: bytes, out_target: str | None = None):
-    header_end = raw.find(b"\r\n\r\n")
-    if header_end == -1:
+def _save_body(s: socket.socket, leftover: bytearray, length: int | None, path: str):
+    with open(path, "wb") as f:
+        _stream_body(s, f, leftover, length)
+
+
+def _handle_response(s: socket.socket, out_target: str | None = None):
+    header_bytes, leftover = _read_headers(s)
+    if header_bytes is None:
         print("Malformed response: no header terminator")
-        print(raw.decode("utf-8", errors="ignore"))
+        print(leftover.decode("utf-8", errors="ignore"))
         return
-    header_bytes = raw[:header_end]
-    body = raw[header_end + 4 :]
-    header_text = header_bytes.decode("iso-8859-1", errors="ignore")
-    lines = header_text.split("\r\n")
-    status_line = lines[0]
-    header_pairs = {}
-    for line in lines[1:]:
-        if ":" in line:
-            k, v = line.split(":", 1)
-            header_pairs[k.strip().lower()] = v.strip()
-    content_type = header_pairs.get("content-type", "")
-    if content_type.startswith("text/html"):
+    status_line, header_pairs = _parse_headers(header_bytes)
+    length = _content_length(header_pairs)
+    content_type = header_pairs.get(_CONTENT_TYPE, b"")
+    if content_type.startswith(b"text/html"):
+        body = _recv_all(s, leftover)
         try:
             text = body.decode("utf-8")
         except UnicodeDecodeError:
             text = body.decode("iso-8859-1", errors="ignore")
         print(text)
-    elif content_type.startswith("image/png"):
+    elif content_type.startswith(b"image/png"):
         path = _resolve_output_path(out_target, default_name="download.png", suggested_name=_extract_filename_from_headers(header_pairs, fallback="download.png"))
-        with open(path, "wb") as f:
-            f.write(body)
+        _save_body(s, leftover, length, path)
         print(f"Saved PNG to {path}")
-    elif content_type.startswith("application/pdf"):
+    elif content_type.startswith(b"application/pdf"):
         path = _resolve_output_path(out_target, default_name="download.pdf", suggested_name=_extract_filename_from_headers(header_pairs, fallback="download.pdf"))
-        with open(path, "wb") as f:
-            f.write(body)
+        _save_body(s, leftover, length, path)
         print(f"Saved PDF to {path}")
     else:
-        print(status_line)
+        print(status_line.decode("iso-8859-1"))
         for k, v in header_pairs.items():
-            print(f"{k}: {v}")
-        if body:
+            print(f"{k.decode('iso-8859-1')}: {v.decode('iso-8859-1')}")
+        if not leftover and length != 0:
+            # Peek so an empty body does not create an empty file
+            leftover = bytearray(s.recv(RECV_CHUNK))
+        if leftover:
             path = _resolve_output_path(out_target, default_name="download.bin", suggested_name=_extract_filename_from_headers(header_pairs, fallback="download.bin"))
-            with open(path, "wb") as f:
-                f.write(body)
+            _save_body(s, leftover, length, path)
             print(f"Saved body to {path}")
 
 
-def _extract_filename_from_headers(headers: dict, fallback: str) -> str:
-    cd = headers.get("content-disposition")
-    if cd and "filename=" in cd:
-        part = cd.split("filename=", 1)[1].strip().strip('"')
+def _extract_filename_from_headers(headers: dict[bytes, bytes], fallback: str) -> str:
+    cd = headers.get(_CONTENT_DISPOSITION)
+    if cd and b"filename=" in cd:
+        part = cd.split(b"filename=", 1)[1].strip().strip(b'"')
         if part:
-            return part
+            return part.decode("iso-8859-1")
     return fallback
 
 
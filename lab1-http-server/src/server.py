@@ -6,53 +6,52 @@ from urllib.parse import urlsplit, unquote
 
 HOST, PORT = "0.0.0.0", 8080
 
-def build_response(body: bytes, status: int = 200, content_type: str = "text/html; charset=utf-8", extra_headers: dict | None = None) -> bytes:
-    reason = {200: "OK", 404: "Not Found"}.get(status, "OK")
-    headers = [
-        f"HTTP/1.1 {status} {reason}",
-        f"Content-Type: {content_type}",
-        f"Content-Length: {len(body)}",
-        "Connection: close",
-    ]
+# Preformatted header fragments so build_response only joins bytes
+_STATUS = {
+    200: b"HTTP/1.1 200 OK\r\n",
+    404: b"HTTP/1.1 404 Not Found\r\n",
+}
+_CT = b"Content-Type: "
+_CL = b"\r\nContent-Length: "
+_CONN_CLOSE = b"\r\nConnection: close\r\n"
+_CTYPE_BYTES: dict[str, bytes] = {}  # content type -> encoded form
+
+def build_response(body: bytes | None, status: int = 200, content_type: str = "text/html; charset=utf-8", extra_headers: dict | None = None, content_length: int | None = None) -> bytes:
+    # body=None builds only the header block; the caller streams content_length bytes after it
+    status_line = _STATUS.get(status) or f"HTTP/1.1 {status} OK\r\n".encode("utf-8")
+    ctype = _CTYPE_BYTES.get(content_type)
+    if ctype is None:
+        ctype = _CTYPE_BYTES[content_type] = content_type.encode("utf-8")
+    length = len(body) if body is not None else content_length
+    parts = [status_line, _CT, ctype, _CL, str(length).encode("ascii"), _CONN_CLOSE]
     if extra_headers:
         for k, v in extra_headers.items():
-            headers.append(f"{k}: {v}")
-    headers.extend(["", ""])  # end of headers
-    return "\r\n".join(headers).encode("utf-8") + body
-
-def guess_mime(path: str, content: bytes | None = None) -> str:
-    ext = os.path.splitext(path.lower())[1]
-    if ext in {".html", ".htm"}:
-        return "text/html; charset=utf-8"
-    if ext == ".css":
-        return "text/css; charset=utf-8"
-    if ext == ".js":
-        return "application/javascript; charset=utf-8"
-    if ext == ".json":
-        return "application/json; charset=utf-8"
-    if ext == ".svg":
-        return "image/svg+xml"
-    if ext in {".jpg", ".jpeg"}:
-        return "image/jpeg"
-    if ext == ".png":
-        return "image/png"
-    if ext == ".gif":
-        return "image/gif"
-    if ext == ".pdf":
-        return "application/pdf"
-    if ext == ".txt":
-        return "text/plain; charset=utf-8"
-
-    # Try to detect text payload if content is provided
-    if content is not None:
-        try:
-            content.decode("utf-8")
-            return "text/plain; charset=utf-8"
-        except UnicodeDecodeError:
-            pass
-    return "application/octet-stream"
+            parts.append(f"{k}: {v}\r\n".encode("utf-8"))
+    parts.append(b"\r\n")  # end of headers
+    if body is not None:
+        parts.append(body)
+    return b"".join(parts)
+
+_MIME = {
+    ".html": "text/html; charset=utf-8",
+    ".htm": "text/html; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".js": "application/javascript; charset=utf-8",
+    ".json": "application/json; charset=utf-8",
+    ".svg": "image/svg+xml",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".pdf": "application/pdf",
+    ".txt": "text/plain; charset=utf-8",
+}
+
+def guess_mime(path: str) -> str:
+    return _MIME.get(os.path.splitext(path.lower())[1], "application/octet-stream")
 
-def serve_file(path: str, base_dir: str) -> bytes:
+def serve_file(path: str, base_abs: str) -> tuple[bytes, str | None]:
+    """Return (response bytes, file to sendfile after them or None). base_abs must be absolute."""
     inline_mode = False
     # Support /inline/<rest> path to allow displaying PNG inline (no forced download)
     if path.startswith('/inline/'):
@@ -60,29 +59,30 @@ def serve_file(path: str, base_dir: str) -> bytes:
         path = path[len('/inline'):]  # keep leading slash before filename
     # Normalize and prevent path traversal
     requested_rel = path.lstrip("/")
-    full_path = os.path.normpath(os.path.join(base_dir, requested_rel))
-    base_abs = os.path.abspath(base_dir)
-    full_abs = os.path.abspath(full_path)
-    if not full_abs.startswith(base_abs):
-        return build_response(b"<h1>404 Not Found</h1>", status=404)
+    full_abs = os.path.normpath(os.path.join(base_abs, requested_rel))
+    # Separator-aware prefix check so /content does not match /content-private
+    if full_abs != base_abs and not full_abs.startswith(base_abs + os.sep):
+        return build_response(b"<h1>404 Not Found</h1>", status=404), None
 
     # Directory handling: ALWAYS produce a directory listing per lab specification
     if os.path.isdir(full_abs):
         try:
-            entries = sorted(os.listdir(full_abs))
+            # scandir returns the entry type with the name, so no per-entry stat is needed
+            with os.scandir(full_abs) as it:
+                entries = sorted(it, key=lambda e: e.name)
         except OSError:
-            return build_response(b"<h1>404 Not Found</h1>", status=404)
+            return build_response(b"<h1>404 Not Found</h1>", status=404), None
 
         # Build listing (directories shown with trailing slash)
         path_prefix = path if path.startswith("/") else "/" + path
         path_prefix = path_prefix.rstrip("/") or "/"
         items = []
-        if os.path.abspath(full_abs) != os.path.abspath(base_abs):  # parent link
+        if full_abs != base_abs:  # parent link
             parent = os.path.dirname(path_prefix.rstrip("/")) or "/"
             items.append(f'<li><a href="{parent}">..</a></li>')
-        for name in entries:
-            entry_abs = os.path.join(full_abs, name)
-            if os.path.isdir(entry_abs):
+        for entry in entries:
+            name = entry.name
+            if entry.is_dir():
                 display = name + "/"
                 href = (f"{path_prefix.rstrip('/')}/{display}" if path_prefix != "/" else f"/{display}")
             else:
@@ -90,30 +90,39 @@ def serve_file(path: str, base_dir: str) -> bytes:
                 href = f"{path_prefix.rstrip('/')}/{name}" if path_prefix != "/" else f"/{name}"
             items.append(f'<li><a href="{href}">{display}</a></li>')
         listing_html = f"<h1>Directory listing for {path_prefix}</h1><ul>{''.join(items)}</ul>"
-        return build_response(listing_html.encode("utf-8"), status=200)
+        return build_response(listing_html.encode("utf-8"), status=200), None
 
     # Serve files: only allow specific extensions per lab spec; otherwise 404
     if os.path.isfile(full_abs):
+        ext = os.path.splitext(full_abs.lower())[1]
+        allowed = {".html", ".htm", ".png", ".pdf"}  # per lab requirement
+        if ext not in allowed:
+            return build_response(b"<h1>404 Not Found</h1>", status=404), None
         try:
-            with open(full_abs, "rb") as f:
-                body = f.read()
-            ext = os.path.splitext(full_abs.lower())[1]
-            allowed = {".html", ".htm", ".png", ".pdf"}  # per lab requirement
-            if ext not in allowed:
-                return build_response(b"<h1>404 Not Found</h1>", status=404)
-            content_type = guess_mime(full_abs, body)
-            extra = None
-            if ext == ".pdf":  # always download PDFs
-                filename = os.path.basename(full_abs)
-                extra = {"Content-Disposition": f"attachment; filename=\"{filename}\""}
-            elif ext == ".png" and not inline_mode:  # download PNG unless inline path used
-                filename = os.path.basename(full_abs)
-                extra = {"Content-Disposition": f"attachment; filename=\"{filename}\""}
-            return build_response(body, status=200, content_type=content_type, extra_headers=extra)
+            size = os.path.getsize(full_abs)
         except OSError:
-            return build_response(b"<h1>404 Not Found</h1>", status=404)
+            return build_response(b"<h1>404 Not Found</h1>", status=404), None
+        content_type = guess_mime(full_abs)
+        extra = None
+        if ext == ".pdf":  # always download PDFs
+            filename = os.path.basename(full_abs)
+            extra = {"Content-Disposition": f"attachment; filename=\"{filename}\""}
+        elif ext == ".png" and not inline_mode:  # download PNG unless inline path used
+            filename = os.path.basename(full_abs)
+            extra = {"Content-Disposition": f"attachment; filename=\"{filename}\""}
+        # Headers only; the body goes out via sendfile(2) without a userspace copy
+        return build_response(None, status=200, content_type=content_type, extra_headers=extra, content_length=size), full_abs
 
-    return build_response(b"<h1>404 Not Found</h1>", status=404)
+    return build_response(b"<h1>404 Not Found</h1>", status=404), None
+
+
+def request_path(target: bytes) -> str:
+    # Fast path: a plain ASCII origin-form path needs no urlsplit/unquote
+    q = target.find(b"?")
+    path_b = target if q == -1 else target[:q]
+    if path_b.startswith(b"/") and path_b.isascii() and b"%" not in path_b and b"#" not in path_b:
+        return path_b.decode("ascii")
+    return unquote(urlsplit(target.decode(errors="ignore")).path or "/")
 
 
 def run_server(base_dir):
@@ -123,15 +132,19 @@ def run_server(base_dir):
     except Exception:
         # Non-fatal if creation fails; server can still run
         pass
+    base_abs = os.path.abspath(base_dir)  # resolved once, not per request
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
         server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # prevents "Address already in use"
         server_socket.bind((HOST, PORT))
-        server_socket.listen(1)
+        server_socket.listen(socket.SOMAXCONN)
         print(f"Serving {base_dir} on http://{HOST}:{PORT}")
 
         while True:
             client_conn, client_addr = server_socket.accept()
-            request = client_conn.recv(1024).decode(errors="ignore")
+            # Send small responses immediately instead of waiting on Nagle.
+            # SO_RCVBUF/SO_SNDBUF are intentionally left alone so kernel autotuning stays on.
+            client_conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            request = client_conn.recv(8192)
             if not request:
                 client_conn.close()
                 continue
@@ -139,16 +152,21 @@ def run_server(base_dir):
             # Parse request line and URL components safely
             try:
                 request_line = request.splitlines()[0]
-                method, target, _ = request_line.split(" ", 2)
+                method, target, _ = request_line.split(b" ", 2)
             except ValueError:
                 client_conn.close()
                 continue
 
-            parts = urlsplit(target)
-            raw_path = parts.path or "/"
-            path = unquote(raw_path)
-            response = serve_file(path, base_dir)
-            client_conn.sendall(response)
+            path = request_path(target)
+            response, file_path = serve_file(path, base_abs)
+            try:
+                client_conn.sendall(response)
+                if file_path is not None:
+                    with open(file_path, "rb") as f:
+                        client_conn.sendfile(f)
+            except OSError:
+                # Client went away (BrokenPipe/ConnectionReset) or the file vanished mid-request
+                pass
             client_conn.close()
 
 if __name__ == "__main__":
@@ -5,31 +5,76 @@ import time
 from urllib.parse import urlsplit
 
 
-def do_get(host: str, port: int, path: str, results: list[int], timeout: float | None = 5.0):
+class ClosedBeforeResponse(ConnectionError):
+    """The server closed the connection before sending any response bytes."""
+
+
+def read_response(s: socket.socket) -> tuple[int, bool]:
+    """Read one full response; returns (status code, whether the server keeps the connection open)."""
+    buf = b""
+    while b"\r\n\r\n" not in buf:
+        data = s.recv(4096)
+        if not data:
+            if not buf:
+                raise ClosedBeforeResponse("connection closed before response")
+            raise ConnectionError("connection closed mid-response")
+        buf += data
+    head, _, body = buf.partition(b"\r\n\r\n")
+    lines = head.split(b"\r\n")
+    parts = lines[0].split(b" ")
+    code = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+    length = 0
+    keep_alive = True
+    for line in lines[1:]:
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-length":
+            length = int(value.strip())
+        elif name == b"connection":
+            keep_alive = value.strip().lower() != b"close"
+    # Consume the body so the next response starts on a clean boundary
+    remaining = length - len(body)
+    while remaining > 0:
+        data = s.recv(min(remaining, 1 << 16))
+        if not data:
+            raise ConnectionError("connection closed mid-body")
+        remaining -= len(data)
+    return code, keep_alive
+
+
+def do_get(sock: socket.socket | None, host: str, port: int, path: str, results: list[int], timeout: float | None = 5.0, keep_alive: bool = True) -> socket.socket | None:
+    """Send one GET, reusing sock when possible; returns the socket to reuse next time (or None)."""
+    req = (
+        f"GET {path} HTTP/1.1\r\n"
+        f"Host: {host}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        f"User-Agent: bench/1.0\r\n"
+        f"Accept: */*\r\n\r\n"
+    ).encode()
+    connect_timeout = timeout if timeout and timeout > 0 else None
+    reused = sock is not None
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            if timeout and timeout > 0:
-                s.settimeout(timeout)
-            s.connect((host, port))
-            req = (
-                f"GET {path} HTTP/1.1\r\n"
-                f"Host: {host}\r\n"
-                f"Connection: close\r\n"
-                f"User-Agent: bench/1.0\r\n"
-                f"Accept: */*\r\n\r\n"
-            )
-            s.sendall(req.encode())
-            # read response status line
-            data = s.recv(4096)
-            if not data:
-                results.append(0)
-                return
-            line = data.split(b"\r\n", 1)[0].decode(errors="ignore")
-            parts = line.split(" ")
-            code = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
-            results.append(code)
+        if sock is None:
+            sock = socket.create_connection((host, port), timeout=connect_timeout)
+        try:
+            sock.sendall(req)
+            code, server_keeps = read_response(sock)
+        except (ClosedBeforeResponse, ConnectionResetError, BrokenPipeError):
+            if not reused:
+                raise
+            # The server dropped the idle keep-alive connection; reconnect once and resend
+            sock.close()
+            sock = socket.create_connection((host, port), timeout=connect_timeout)
+            sock.sendall(req)
+            code, server_keeps = read_response(sock)
+        results.append(code)
+        if keep_alive and server_keeps:
+            return sock
     except Exception:
         results.append(0)
+    if sock is not None:
+        sock.close()
+    return None
 
 
 def main():
@@ -42,20 +87,26 @@ def main():
     ap.add_argument("--rate", type=float, default=0.0, help="requests/sec per worker, 0 = as fast as possible")
     ap.add_argument("--duration", type=float, default=0.0, help="seconds to run in rate mode (overrides per-worker)")
     ap.add_argument("--timeout", type=float, default=5.0, help="socket timeout in seconds (default 5.0)")
+    ap.add_argument("--no-keepalive", action="store_true", help="open a new connection per request")
     args = ap.parse_args()
 
     codes: list[int] = []
+    keep_alive = not args.no_keepalive
 
     def worker():
+        # One connection per worker, reused across requests while the server keeps it open
+        sock = None
         if args.rate > 0 and args.duration > 0:
             interval = 1.0 / args.rate
             end = time.perf_counter() + args.duration
             while time.perf_counter() < end:
-                do_get(args.host, args.port, args.path, codes, timeout=args.timeout)
+                sock = do_get(sock, args.host, args.port, args.path, codes, timeout=args.timeout, keep_alive=keep_alive)
                 time.sleep(interval)
         else:
             for _ in range(args.per_worker):
-                do_get(args.host, args.port, args.path, codes, timeout=args.timeout)
+                sock = do_get(sock, args.host, args.port, args.path, codes, timeout=args.timeout, keep_alive=keep_alive)
+        if sock is not None:
+            sock.close()
 
     threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
     t0 = time.perf_counter()
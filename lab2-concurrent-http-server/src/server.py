@@ -1,109 +1,168 @@
 import os
 import sys
+import array
 import socket
-import threading
+import signal
+import asyncio
+import stat
 import time
-from collections import deque, defaultdict
+from functools import lru_cache
 from urllib.parse import urlsplit, unquote
 
 HOST = "0.0.0.0"
 PORT = int(os.environ.get("PORT", 8081))
 DELAY_MS = int(os.environ.get("DELAY_MS", 1000))  # simulate work per request
-COUNTER_MODE = os.environ.get("COUNTER_MODE", "naive")  # naive | locked
-RATE_LIMIT = int(os.environ.get("RATE_LIMIT", 5))  # per-IP requests per WINDOW_SEC
+COUNTER_MODE = os.environ.get("COUNTER_MODE", "naive")  # naive | locked | off
+RATE_LIMIT = int(os.environ.get("RATE_LIMIT", 5))  # per-IP requests per WINDOW_SEC (0 = off)
 WINDOW_SEC = float(os.environ.get("WINDOW_SEC", 1.0))
-
-# Request counters (path -> count)
-request_counts: dict[str, int] = defaultdict(int)
-counts_lock = threading.Lock()
-
-# Rate limiter data: ip -> deque[timestamps]
-ip_windows: dict[str, deque] = defaultdict(deque)
-rate_lock = threading.Lock()
-
-
-def build_response(body: bytes, status: int = 200, content_type: str = "text/html; charset=utf-8", extra_headers: dict | None = None) -> bytes:
-    reason = {200: "OK", 404: "Not Found", 429: "Too Many Requests"}.get(status, "OK")
-    headers = [
-        f"HTTP/1.1 {status} {reason}",
-        f"Content-Type: {content_type}",
-        f"Content-Length: {len(body)}",
-        "Connection: close",
-    ]
+# Worker processes sharing the port via SO_REUSEPORT (0 = one per core).
+# Hit counters and rate-limit buckets live in each process, so more than one worker
+# is only used with COUNTER_MODE=off and RATE_LIMIT=0 (see run_server).
+WORKERS = int(os.environ.get("WORKERS", 1)) or os.cpu_count() or 1
+
+# Request counters: each path gets a small id at startup and its count lives in a flat array.
+# Paths first seen after startup (files added later) are appended on demand.
+path_to_id: dict[str, int] = {}
+counters = array.array("Q")
+
+# Token-bucket rate limiter: ip -> (tokens, last_refill_monotonic)
+# All handlers run on one event loop, so no lock is needed around this state.
+ip_tokens: dict[str, tuple[float, float]] = {}
+REFILL_PER_SEC = RATE_LIMIT / WINDOW_SEC
+MAX_TRACKED_IPS = 10_000
+KEEPALIVE_SEC = float(os.environ.get("KEEPALIVE_SEC", 5.0))  # idle persistent connections are closed after this
+
+# Large binary bodies are sent with sendfile(2); HTML stays cached in memory
+SENDFILE_EXTS = {".pdf", ".png"}
+
+
+# Preformatted header fragments so build_response only joins bytes
+_STATUS = {
+    200: b"HTTP/1.1 200 OK\r\n",
+    404: b"HTTP/1.1 404 Not Found\r\n",
+    429: b"HTTP/1.1 429 Too Many Requests\r\n",
+}
+_CT = b"Content-Type: "
+_CL = b"\r\nContent-Length: "
+_CONN_CLOSE = b"\r\nConnection: close\r\n"
+_CONN_KEEP_ALIVE = b"\r\nConnection: keep-alive\r\n"
+_CTYPE_BYTES: dict[str, bytes] = {}  # content type -> encoded form
+
+
+def build_response(body: bytes | None, status: int = 200, content_type: str = "text/html; charset=utf-8", extra_headers: dict | None = None, content_length: int | None = None, keep_alive: bool = False) -> bytes:
+    # body=None builds only the header block; the caller streams content_length bytes after it
+    status_line = _STATUS.get(status) or f"HTTP/1.1 {status} OK\r\n".encode("utf-8")
+    ctype = _CTYPE_BYTES.get(content_type)
+    if ctype is None:
+        ctype = _CTYPE_BYTES[content_type] = content_type.encode("utf-8")
+    length = len(body) if body is not None else content_length
+    parts = [status_line, _CT, ctype, _CL, str(length).encode("ascii"), _CONN_KEEP_ALIVE if keep_alive else _CONN_CLOSE]
     if extra_headers:
         for k, v in extra_headers.items():
-            headers.append(f"{k}: {v}")
-    headers.extend(["", ""])  # end of headers
-    return "\r\n".join(headers).encode("utf-8") + body
+            parts.append(f"{k}: {v}\r\n".encode("utf-8"))
+    parts.append(b"\r\n")  # end of headers
+    if body is not None:
+        parts.append(body)
+    return b"".join(parts)
+
+
+_MIME = {
+    ".html": "text/html; charset=utf-8",
+    ".htm": "text/html; charset=utf-8",
+    ".png": "image/png",
+    ".pdf": "application/pdf",
+}
 
 
 def guess_mime(path: str) -> str:
-    ext = os.path.splitext(path.lower())[1]
-    if ext in {".html", ".htm"}:
-        return "text/html; charset=utf-8"
-    if ext == ".png":
-        return "image/png"
-    if ext == ".pdf":
-        return "application/pdf"
-    return "application/octet-stream"
+    return _MIME.get(os.path.splitext(path.lower())[1], "application/octet-stream")
 
 
 def allow_request(ip: str) -> bool:
     now = time.monotonic()
-    with rate_lock:
-        q = ip_windows[ip]
-        # drop older than window
-        cutoff = now - WINDOW_SEC
-        while q and q[0] < cutoff:
-            q.popleft()
-        if len(q) < RATE_LIMIT:
-            q.append(now)
-            return True
-        return False
-
-
-def increment_counter(path: str):
+    tokens, last = ip_tokens.get(ip, (RATE_LIMIT, now))
+    tokens = min(RATE_LIMIT, tokens + (now - last) * REFILL_PER_SEC)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    if ip not in ip_tokens and len(ip_tokens) >= MAX_TRACKED_IPS:
+        sweep_idle_ips(now)
+    ip_tokens[ip] = (tokens, now)
+    return allowed
+
+
+def sweep_idle_ips(now: float):
+    # A bucket idle for a full window has refilled, so forgetting it changes nothing
+    idle = [ip for ip, (_, last) in ip_tokens.items() if now - last >= WINDOW_SEC]
+    for ip in idle:
+        del ip_tokens[ip]
+
+
+def index_paths(base_abs: str):
+    """Assign a counter slot to every file and directory under base_abs."""
+    path_to_id["/"] = 0
+    for root, dirs, files in os.walk(base_abs):
+        rel = os.path.relpath(root, base_abs).replace(os.sep, "/")
+        prefix = "" if rel == "." else "/" + rel
+        for name in dirs + files:
+            path_to_id.setdefault(f"{prefix}/{name}", len(path_to_id))
+    counters.extend([0] * (len(path_to_id) - len(counters)))
+
+
+def counter_id(p: str) -> int:
+    i = path_to_id.get(p)
+    if i is None:
+        i = path_to_id[p] = len(counters)
+        counters.append(0)
+    return i
+
+
+def get_hits(p: str) -> int:
+    i = path_to_id.get(p)
+    return 0 if i is None else counters[i]
+
+
+async def increment_counter(path: str):
+    if COUNTER_MODE == "off":
+        return
     # Normalize path representation for counting
-    p = path.rstrip("/") or "/"
+    i = counter_id(path.rstrip("/") or "/")
     if COUNTER_MODE == "naive":
         # introduce a small timing window to surface races
-        current = request_counts.get(p, 0)
-        time.sleep(0.005)
-        request_counts[p] = current + 1
+        current = counters[i]
+        await asyncio.sleep(0.005)
+        counters[i] = current + 1
     else:
-        with counts_lock:
-            request_counts[p] += 1
+        # No await between read and write, so the update is atomic on the event loop
+        counters[i] += 1
 
 
-def render_dir_listing(dir_abs: str, base_abs: str, req_path: str) -> bytes:
+def render_dir_listing(dir_abs: str, base_abs: str, req_path: str, keep_alive: bool = False) -> bytes:
     try:
-        entries = sorted(os.listdir(dir_abs))
+        # scandir returns the entry type with the name, so no per-entry stat is needed
+        with os.scandir(dir_abs) as it:
+            entries = sorted(it, key=lambda e: e.name)
     except OSError:
-        return build_response(b"<h1>404 Not Found</h1>", status=404)
+        return build_response(b"<h1>404 Not Found</h1>", status=404, keep_alive=keep_alive)
 
     prefix = req_path if req_path.startswith("/") else "/" + req_path
     prefix = prefix.rstrip("/") or "/"
 
+    prefix_trim = prefix.rstrip("/")  # "" for the root listing
     rows = []
 
     # parent link row
-    if os.path.abspath(dir_abs) != os.path.abspath(base_abs):
-        parent = os.path.dirname(prefix.rstrip("/")) or "/"
-        parent_hits = request_counts.get(parent.rstrip("/"), 0)
+    if dir_abs != base_abs:
+        parent = os.path.dirname(prefix_trim) or "/"
+        parent_hits = get_hits(parent.rstrip("/") or "/")
         rows.append(f"<tr><td><a href=\"{parent}\">..</a></td><td>{parent_hits}</td></tr>")
 
-    for name in entries:
-        entry_abs = os.path.join(dir_abs, name)
-        if os.path.isdir(entry_abs):
-            display = name + "/"
-            href = (f"{prefix.rstrip('/')}/{display}" if prefix != "/" else f"/{display}")
-            hits = request_counts.get(href.rstrip("/"), 0)
-        else:
-            display = name
-            href = f"{prefix.rstrip('/')}/{name}" if prefix != "/" else f"/{name}"
-            # Show the number stored for this file path
-            hits = request_counts.get(href.rstrip("/"), 0)
-        rows.append(f"<tr><td><a href=\"{href}\">{display}</a></td><td>{hits}</td></tr>")
+    for entry in entries:
+        name = entry.name
+        # Hits are keyed by the path without the trailing slash directories get in the href
+        key = f"{prefix_trim}/{name}"
+        slash = "/" if entry.is_dir() else ""
+        rows.append(f"<tr><td><a href=\"{key}{slash}\">{name}{slash}</a></td><td>{get_hits(key)}</td></tr>")
 
     table = (
         "<table border=\"1\" cellspacing=\"0\" cellpadding=\"6\">"
@@ -112,84 +171,183 @@ def render_dir_listing(dir_abs: str, base_abs: str, req_path: str) -> bytes:
         "</table>"
     )
     html = f"<h1>Directory listing for {prefix}</h1>{table}"
-    return build_response(html.encode("utf-8"), 200, "text/html; charset=utf-8")
+    return build_response(html.encode("utf-8"), 200, "text/html; charset=utf-8", keep_alive=keep_alive)
 
 
-def handle_request(path: str, base_dir: str) -> bytes:
+async def handle_request(path: str, base_abs: str, keep_alive: bool = False) -> tuple[bytes, str | None]:
+    """Return (response bytes, file to sendfile after them or None). base_abs must be absolute."""
     # Directory handling
     requested_rel = path.lstrip("/")
-    full_abs = os.path.abspath(os.path.normpath(os.path.join(base_dir, requested_rel)))
-    base_abs = os.path.abspath(base_dir)
-    if not full_abs.startswith(base_abs):
-        return build_response(b"<h1>404 Not Found</h1>", status=404)
+    full_abs = os.path.normpath(os.path.join(base_abs, requested_rel))
+    # Separator-aware prefix check so /content does not match /content-private
+    if full_abs != base_abs and not full_abs.startswith(base_abs + os.sep):
+        return build_response(b"<h1>404 Not Found</h1>", status=404, keep_alive=keep_alive), None
 
-    if os.path.isdir(full_abs):
+    try:
+        st = os.stat(full_abs)
+    except OSError:
+        return build_response(b"<h1>404 Not Found</h1>", status=404, keep_alive=keep_alive), None
+
+    if stat.S_ISDIR(st.st_mode):
         # Count directory opens as hits too
-        increment_counter(path)
-        return render_dir_listing(full_abs, base_abs, path)
+        await increment_counter(path)
+        return render_dir_listing(full_abs, base_abs, path, keep_alive), None
 
-    if os.path.isfile(full_abs):
+    if stat.S_ISREG(st.st_mode):
         ext = os.path.splitext(full_abs.lower())[1]
         if ext not in {".html", ".htm", ".png", ".pdf"}:
-            return build_response(b"<h1>404 Not Found</h1>", status=404)
+            return build_response(b"<h1>404 Not Found</h1>", status=404, keep_alive=keep_alive), None
         try:
-            with open(full_abs, "rb") as f:
-                body = f.read()
+            resp = cached_file_response(full_abs, st.st_mtime_ns, st.st_size, keep_alive)
         except OSError:
-            return build_response(b"<h1>404 Not Found</h1>", status=404)
-        increment_counter(path)
-        ctype = guess_mime(full_abs)
-        extra = None
-        if ext in {".pdf", ".png"}:
-            filename = os.path.basename(full_abs)
-            extra = {"Content-Disposition": f"attachment; filename=\"{filename}\""}
-        return build_response(body, 200, ctype, extra)
-
-    return build_response(b"<h1>404 Not Found</h1>", status=404)
-
-
-def handle_client(conn: socket.socket, addr, base_dir: str):
+            return build_response(b"<h1>404 Not Found</h1>", status=404, keep_alive=keep_alive), None
+        await increment_counter(path)
+        return resp, (full_abs if ext in SENDFILE_EXTS else None)
+
+    return build_response(b"<h1>404 Not Found</h1>", status=404, keep_alive=keep_alive), None
+
+
+@lru_cache(maxsize=256)
+def cached_file_response(full_abs: str, mtime_ns: int, size: int, keep_alive: bool = False) -> bytes:
+    # mtime/size are part of the key so an edited file gets a fresh entry
+    ext = os.path.splitext(full_abs.lower())[1]
+    ctype = guess_mime(full_abs)
+    if ext in SENDFILE_EXTS:
+        # Cache only the headers; the body goes out via sendfile(2) without a userspace copy
+        filename = os.path.basename(full_abs)
+        extra = {"Content-Disposition": f"attachment; filename=\"{filename}\""}
+        return build_response(None, 200, ctype, extra, content_length=size, keep_alive=keep_alive)
+    with open(full_abs, "rb") as f:
+        body = f.read()
+    return build_response(body, 200, ctype, keep_alive=keep_alive)
+
+
+def request_path(target: bytes) -> str:
+    # Fast path: a plain ASCII origin-form path needs no urlsplit/unquote
+    q = target.find(b"?")
+    path_b = target if q == -1 else target[:q]
+    if path_b.startswith(b"/") and path_b.isascii() and b"%" not in path_b and b"#" not in path_b:
+        return path_b.decode("ascii")
+    return unquote(urlsplit(target.decode(errors="ignore")).path or "/")
+
+
+def parse_request_headers(head: bytes) -> dict[bytes, bytes]:
+    headers = {}
+    for line in head.split(b"\r\n")[1:]:
+        name, sep, value = line.partition(b":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+def wants_keep_alive(version: bytes, headers: dict[bytes, bytes]) -> bool:
+    conn = headers.get(b"connection", b"").lower()
+    if version == b"HTTP/1.1":
+        return conn != b"close"
+    return conn == b"keep-alive"
+
+
+async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, base_abs: str):
+    addr = writer.get_extra_info("peername")
     try:
-        # Basic request read
-        data = conn.recv(2048)
-        if not data:
-            return
-        try:
-            req_line = data.split(b"\r\n", 1)[0].decode(errors="ignore")
-            method, target, _ = req_line.split(" ", 2)
-        except Exception:
-            return
-        parts = urlsplit(target)
-        path = unquote(parts.path or "/")
-
-        # Rate limiting
-        ip = addr[0]
-        if not allow_request(ip):
-            conn.sendall(build_response(b"<h1>429 Too Many Requests</h1>", 429))
-            return
-
-        # Simulate work
-        time.sleep(DELAY_MS / 1000.0)
-
-        resp = handle_request(path, base_dir)
-        conn.sendall(resp)
+        # Serve requests in order until the client asks to close or goes idle (HTTP/1.1 keep-alive;
+        # pipelined requests simply wait in the reader's buffer)
+        keep_alive = True
+        while keep_alive:
+            try:
+                data = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_SEC)
+            except asyncio.IncompleteReadError as e:
+                data = e.partial
+            except (asyncio.LimitOverrunError, asyncio.TimeoutError):
+                return
+            if not data:
+                return
+            try:
+                req_line = data.split(b"\r\n", 1)[0]
+                method, target, version = req_line.split(b" ", 2)
+            except Exception:
+                return
+            headers = parse_request_headers(data)
+            keep_alive = data.endswith(b"\r\n\r\n") and wants_keep_alive(version, headers)
+            # Drain any request body so it is not parsed as the next request
+            body_len = headers.get(b"content-length", b"0")
+            if body_len.isdigit() and int(body_len):
+                await reader.readexactly(int(body_len))
+            path = request_path(target)
+
+            # Rate limiting
+            ip = addr[0]
+            if RATE_LIMIT > 0 and not allow_request(ip):
+                writer.write(build_response(b"<h1>429 Too Many Requests</h1>", 429, keep_alive=keep_alive))
+                await writer.drain()
+                continue
+
+            # Simulate work without blocking the event loop
+            await asyncio.sleep(DELAY_MS / 1000.0)
+
+            resp, file_path = await handle_request(path, base_abs, keep_alive)
+            writer.write(resp)
+            if file_path is not None:
+                with open(file_path, "rb") as f:
+                    await asyncio.get_running_loop().sendfile(writer.transport, f)
+            await writer.drain()
+    except (OSError, asyncio.IncompleteReadError):
+        # Client went away (BrokenPipe/ConnectionReset) or the file vanished mid-request
+        pass
     finally:
         try:
-            conn.close()
+            writer.close()
+            await writer.wait_closed()
         except Exception:
             pass
 
 
+async def main(base_dir: str, reuse_port: bool = False):
+    # asyncio enables TCP_NODELAY on every accepted TCP transport, so small responses are
+    # not held back by Nagle. SO_RCVBUF/SO_SNDBUF are intentionally left to kernel autotuning.
+    base_abs = os.path.abspath(base_dir)  # resolved once, not per request
+    index_paths(base_abs)
+    server = await asyncio.start_server(
+        lambda r, w: handle_client(r, w, base_abs), HOST, PORT, backlog=socket.SOMAXCONN, reuse_port=reuse_port
+    )
+    print(f"[lab2] Serving {base_dir} on http://{HOST}:{PORT} | mode={COUNTER_MODE} delay={DELAY_MS}ms rate={RATE_LIMIT}/s pid={os.getpid()}")
+    async with server:
+        await server.serve_forever()
+
+
 def run_server(base_dir: str):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((HOST, PORT))
-        s.listen(128)
-        print(f"[lab2] Serving {base_dir} on http://{HOST}:{PORT} | mode={COUNTER_MODE} delay={DELAY_MS}ms rate={RATE_LIMIT}/s")
-        while True:
-            conn, addr = s.accept()
-            t = threading.Thread(target=handle_client, args=(conn, addr, base_dir), daemon=True)
-            t.start()
+    # Multi-process accept needs fork + SO_REUSEPORT; fall back to one process elsewhere
+    workers = WORKERS if hasattr(socket, "SO_REUSEPORT") and hasattr(os, "fork") else 1
+    if workers > 1 and (COUNTER_MODE != "off" or RATE_LIMIT > 0):
+        # Per-process counters and buckets would split hits and multiply the per-IP limit
+        print(f"[lab2] WORKERS={workers} needs COUNTER_MODE=off and RATE_LIMIT=0; running 1 worker", file=sys.stderr)
+        workers = 1
+    if workers <= 1:
+        asyncio.run(main(base_dir))
+        return
+
+    # Each child binds its own socket, so the kernel spreads SYNs across per-process accept queues
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                asyncio.run(main(base_dir, reuse_port=True))
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    # Tear the workers down with the parent (Ctrl+C or docker stop)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for _ in children:
+            os.wait()
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
 
 
 if __name__ == "__main__":
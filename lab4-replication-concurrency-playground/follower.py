@@ -4,13 +4,12 @@ Receives replicated writes from the leader.
 """
 
 import os
-import asyncio
 import logging
-from typing import Dict, Optional
+from typing import Dict, List
 from datetime import datetime
 
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 import uvicorn
 
 # Configure logging
@@ -24,86 +23,99 @@ PORT = int(os.getenv("PORT", "8000"))
 app = FastAPI(title=f"Follower Key-Value Store - {FOLLOWER_ID}")
 
 # In-memory key-value store with timestamps for conflict resolution
+# No lock: handlers run on one event loop and never await between reading and writing the dict.
 kv_store: Dict[str, tuple] = {}  # key -> (value, timestamp)
-# Lock for thread-safe operations
-store_lock = asyncio.Lock()
 
 class ReplicateRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     key: str
     value: str
-    timestamp: float
+    timestamp: int
 
-class ReplicateResponse(BaseModel):
-    success: bool
-    key: str
-    follower_id: str
-    message: str
+class ReplicateBatchRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
 
-class ReadResponse(BaseModel):
-    key: str
-    value: Optional[str]
-    found: bool
-    timestamp: Optional[float]
+    entries: List[ReplicateRequest]
 
-@app.post("/replicate", response_model=ReplicateResponse)
+def apply_write(key: str, value: str, timestamp: int) -> bool:
+    """
+    Apply a replicated write using last-write-wins.
+    Returns False if the write was stale and skipped.
+    """
+    existing = kv_store.get(key)
+    if existing is not None and timestamp <= existing[1]:
+        logger.info("[%s] Skipping stale write for %s", FOLLOWER_ID, key)
+        return False
+    kv_store[key] = (value, timestamp)
+    logger.info("[%s] Replicated: %s=%s", FOLLOWER_ID, key, value)
+    return True
+
+@app.post("/replicate")
 async def replicate(request: ReplicateRequest):
     """
     Receive a replicated write from the leader.
     Uses timestamp for conflict resolution (last-write-wins).
+    Returns a plain dict so the hot path skips response-model validation.
     """
-    async with store_lock:
-        # Check if we should apply this write (last-write-wins based on timestamp)
-        if request.key in kv_store:
-            existing_value, existing_timestamp = kv_store[request.key]
-            if request.timestamp <= existing_timestamp:
-                logger.info(f"[{FOLLOWER_ID}] Skipping stale write for {request.key}")
-                return ReplicateResponse(
-                    success=True,
-                    key=request.key,
-                    follower_id=FOLLOWER_ID,
-                    message="Skipped stale write"
-                )
-        
-        # Apply the write
-        kv_store[request.key] = (request.value, request.timestamp)
-        logger.info(f"[{FOLLOWER_ID}] Replicated: {request.key}={request.value}")
-    
-    return ReplicateResponse(
-        success=True,
-        key=request.key,
-        follower_id=FOLLOWER_ID,
-        message="Successfully replicated"
-    )
-
-@app.get("/read/{key}", response_model=ReadResponse)
+    if not apply_write(request.key, request.value, request.timestamp):
+        return {
+            "success": True,
+            "key": request.key,
+            "follower_id": FOLLOWER_ID,
+            "message": "Skipped stale write"
+        }
+
+    return {
+        "success": True,
+        "key": request.key,
+        "follower_id": FOLLOWER_ID,
+        "message": "Successfully replicated"
+    }
+
+@app.post("/replicate_batch")
+async def replicate_batch(request: ReplicateBatchRequest):
+    """
+    Receive several replicated writes from the leader in one request.
+    Entries are applied in order with the same last-write-wins rule as /replicate.
+    """
+    applied = 0
+    for entry in request.entries:
+        if apply_write(entry.key, entry.value, entry.timestamp):
+            applied += 1
+    return {
+        "success": True,
+        "count": len(request.entries),
+        "applied": applied,
+        "follower_id": FOLLOWER_ID
+    }
+
+@app.get("/read/{key}")
 async def read(key: str):
     """
     Read a value from the store.
     """
-    async with store_lock:
-        if key in kv_store:
-            value, timestamp = kv_store[key]
-            return ReadResponse(key=key, value=value, found=True, timestamp=timestamp)
-        else:
-            return ReadResponse(key=key, value=None, found=False, timestamp=None)
+    entry = kv_store.get(key)
+    if entry is not None:
+        value, timestamp = entry
+        return {"key": key, "value": value, "found": True, "timestamp": timestamp}
+    return {"key": key, "value": None, "found": False, "timestamp": None}
 
 @app.get("/keys")
 async def get_keys():
     """
     Get all keys in the store.
     """
-    async with store_lock:
-        return {"keys": list(kv_store.keys()), "follower_id": FOLLOWER_ID}
+    return {"keys": list(kv_store.keys()), "follower_id": FOLLOWER_ID}
 
 @app.get("/all")
 async def get_all():
     """
     Get all key-value pairs in the store.
     """
-    async with store_lock:
-        # Return only values without timestamps for comparison
-        data = {k: v[0] for k, v in kv_store.items()}
-        return {"data": data, "follower_id": FOLLOWER_ID}
+    # Return only values without timestamps for comparison
+    data = {k: v[0] for k, v in kv_store.items()}
+    return {"data": data, "follower_id": FOLLOWER_ID}
 
 @app.get("/health")
 async def health():
@@ -122,10 +134,11 @@ async def clear():
     """
     Clear all data from the store.
     """
-    async with store_lock:
-        kv_store.clear()
+    # Swap in a fresh dict rather than clearing in place
+    global kv_store
+    kv_store = {}
     return {"status": "cleared", "follower_id": FOLLOWER_ID}
 
 if __name__ == "__main__":
-    logger.info(f"Starting follower '{FOLLOWER_ID}' on port {PORT}")
+    logger.info("Starting follower '%s' on port %s", FOLLOWER_ID, PORT)
     uvicorn.run(app, host="0.0.0.0", port=PORT)
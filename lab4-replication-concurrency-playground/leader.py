@@ -4,19 +4,23 @@ Implements semi-synchronous replication with configurable write quorum.
 """
 
 import os
+import time
 import random
 import asyncio
 import logging
-from typing import Dict, List, Optional, Tuple
-from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
 
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, ConfigDict
+import aiorwlock
 import httpx
+import orjson
 import uvicorn
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+# LOG_LEVEL=WARNING silences the per-replication INFO lines under load
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 # Configuration from environment variables
@@ -24,32 +28,84 @@ FOLLOWER_HOSTS = os.getenv("FOLLOWER_HOSTS", "follower1:8000,follower2:8000,foll
 WRITE_QUORUM = int(os.getenv("WRITE_QUORUM", "2"))
 MIN_DELAY = int(os.getenv("MIN_DELAY", "0"))  # milliseconds
 MAX_DELAY = int(os.getenv("MAX_DELAY", "1000"))  # milliseconds
+DELAY_RANGE_MS = range(MIN_DELAY, MAX_DELAY + 1)  # sampled with random.choices, one call per write
 PORT = int(os.getenv("PORT", "8000"))
+# uvicorn worker processes. Each one has its own kv_store, so keep this at 1 unless
+# clients only look at followers (or keys are partitioned in front of the leader).
+# WRITE_QUORUM is per process too, so /config is refused when WORKERS > 1.
+WORKERS = int(os.getenv("WORKERS", "1"))
+# Replication batching: 0 keeps one /replicate POST per write per follower
+REPLICATION_BATCH_MS = float(os.getenv("REPLICATION_BATCH_MS", "0"))  # max time a write waits in the buffer
+REPLICATION_BATCH_MAX = int(os.getenv("REPLICATION_BATCH_MAX", "50"))  # flush early once a buffer holds this many
 
-app = FastAPI(title="Leader Key-Value Store")
+app = FastAPI(title="Leader Key-Value Store", default_response_class=ORJSONResponse)
 
 # In-memory key-value store with timestamps for last-write-wins
-kv_store: Dict[str, tuple] = {}  # key -> (value, timestamp)
-# Lock for thread-safe operations
-store_lock = asyncio.Lock()
+class Entry:
+    """A stored value and its write timestamp; updated in place when a newer write wins."""
+    __slots__ = ("value", "ts")
+
+    def __init__(self, value: str, ts: int):
+        self.value = value
+        self.ts = ts
+
+kv_store: Dict[str, Entry] = {}  # key -> Entry(value, timestamp)
+# Values only, kept in step with kv_store so /all needs no per-request copy
+kv_values: Dict[str, str] = {}
+# /read, /keys, /all and /write share the RW lock; /clear takes it exclusively.
+# Writers additionally serialize per key stripe, so writes to unrelated keys don't wait on each other.
+# aiorwlock binds to the running loop when constructed, so the lock is created on startup.
+rwlock: Optional[aiorwlock.RWLock] = None
+LOCK_STRIPES = 32  # power of two, see lock_for
+stripes = [asyncio.Lock() for _ in range(LOCK_STRIPES)]
+
+def lock_for(key: str) -> asyncio.Lock:
+    """Return the stripe lock guarding key."""
+    return stripes[hash(key) & (LOCK_STRIPES - 1)]
+
+JSON_HEADERS = {"content-type": "application/json"}
 
 # Shared HTTP client for replication (created on startup)
 http_client: Optional[httpx.AsyncClient] = None
 
+# Per-follower buffers of (entry, future) waiting for the next batch flush.
+# Only touched from the event loop without awaits in between, so no lock is needed.
+pending: Dict[str, List[Tuple[dict, asyncio.Future]]] = {host: [] for host in FOLLOWER_HOSTS}
+flush_event = asyncio.Event()
+flusher_task: Optional[asyncio.Task] = None
+# In-flight send_batch tasks; the loop only keeps weak references to tasks
+batch_tasks: Set[asyncio.Task] = set()
+
+# Follower replications started but not yet finished (reported by /replication_status)
+replication_in_flight = 0
+
 @app.on_event("startup")
 async def startup_event():
-    global http_client
-    # Create a persistent HTTP client with connection pooling
-    http_client = httpx.AsyncClient(timeout=10.0)
-    logger.info(f"Leader started with WRITE_QUORUM={WRITE_QUORUM}, delays=[{MIN_DELAY}, {MAX_DELAY}]ms")
+    global http_client, flusher_task, rwlock
+    rwlock = aiorwlock.RWLock(fast=True)
+    # Create a persistent HTTP client with connection pooling; keep a few idle
+    # connections per follower so concurrent writes reuse sockets instead of reconnecting
+    http_client = httpx.AsyncClient(
+        timeout=10.0,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=len(FOLLOWER_HOSTS) * 4),
+    )
+    if REPLICATION_BATCH_MS > 0:
+        flusher_task = asyncio.create_task(batch_flusher())
+    logger.info("Leader started with WRITE_QUORUM=%s, delays=[%s, %s]ms", WRITE_QUORUM, MIN_DELAY, MAX_DELAY)
 
 @app.on_event("shutdown")
 async def shutdown_event():
     global http_client
+    if flusher_task:
+        flusher_task.cancel()
+    for task in batch_tasks:
+        task.cancel()
     if http_client:
         await http_client.aclose()
 
 class WriteRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     key: str
     value: str
 
@@ -65,12 +121,96 @@ class ReadResponse(BaseModel):
     value: Optional[str]
     found: bool
 
+class ConfigRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    write_quorum: int
+
 class ReplicateRequest(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     key: str
     value: str
-    timestamp: float
+    timestamp: int
+
+async def send_batch(host: str, batch: List[Tuple[dict, asyncio.Future]]):
+    """
+    Send one /replicate_batch POST to a follower and resolve every write's future.
+    The simulated network delay is drawn once per batch, since it models one round trip.
+    """
+    delay = random.randint(MIN_DELAY, MAX_DELAY) / 1000.0
+    success = False
+    try:
+        await asyncio.sleep(delay)
+        response = await http_client.post(
+            f"http://{host}/replicate_batch",
+            content=orjson.dumps({"entries": [entry for entry, _ in batch]}),
+            headers=JSON_HEADERS
+        )
+        success = response.status_code == 200
+        if success:
+            logger.info("Replicated batch of %d to %s (delay: %.0fms)", len(batch), host, delay * 1000)
+        else:
+            logger.warning("Failed to replicate batch to %s: %s", host, response.status_code)
+    except Exception as e:
+        logger.error("Error replicating batch to %s: %s", host, e)
+    finally:
+        # Resolve every waiting write even if this task is cancelled, so no /write hangs
+        for _, future in batch:
+            if not future.done():
+                future.set_result((success, delay))
+
+async def batch_flusher():
+    """
+    Background task: every REPLICATION_BATCH_MS (or as soon as a buffer is full)
+    drain each follower's buffer into one batch request.
+    """
+    while True:
+        try:
+            await asyncio.wait_for(flush_event.wait(), timeout=REPLICATION_BATCH_MS / 1000.0)
+        except asyncio.TimeoutError:
+            pass
+        flush_event.clear()
+        for host in FOLLOWER_HOSTS:
+            batch = pending[host]
+            if batch:
+                pending[host] = []
+                task = asyncio.create_task(send_batch(host, batch))
+                batch_tasks.add(task)
+                task.add_done_callback(batch_tasks.discard)
+
+def replication_done(task: asyncio.Future):
+    global replication_in_flight
+    replication_in_flight -= 1
+    # Retrieving the exception here covers tasks still running after their write returned
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Replication task failed: %s", task.exception())
 
-async def replicate_to_followers(key: str, value: str, timestamp: float, quorum: int) -> int:
+def track_in_flight(tasks: List[asyncio.Future]):
+    """
+    Count tasks as in flight until they finish, succeed or not, and log any failure.
+    """
+    global replication_in_flight
+    replication_in_flight += len(tasks)
+    for task in tasks:
+        task.add_done_callback(replication_done)
+
+def enqueue_replication(key: str, value: str, timestamp: int) -> List[asyncio.Future]:
+    """
+    Buffer a write for every follower; each returned future resolves to (success, delay).
+    """
+    loop = asyncio.get_running_loop()
+    entry = {"key": key, "value": value, "timestamp": timestamp}
+    futures = []
+    for host in FOLLOWER_HOSTS:
+        future = loop.create_future()
+        pending[host].append((entry, future))
+        if len(pending[host]) >= REPLICATION_BATCH_MAX:
+            flush_event.set()
+        futures.append(future)
+    return futures
+
+async def replicate_to_followers(key: str, value: str, timestamp: int, quorum: int) -> int:
     """
     Replicate a write to all followers concurrently.
     Uses semi-synchronous replication - waits for quorum confirmations.
@@ -83,8 +223,17 @@ async def replicate_to_followers(key: str, value: str, timestamp: float, quorum:
     """
     global http_client
     
+    if REPLICATION_BATCH_MS > 0:
+        # Batched mode: the flusher sends the requests, we only wait on the futures
+        tasks = enqueue_replication(key, value, timestamp)
+        track_in_flight(tasks)
+        return await wait_for_quorum(tasks, quorum)
+
+    # Serialize the payload once; every follower gets the same bytes
+    body = orjson.dumps({"key": key, "value": value, "timestamp": timestamp})
+    
     # Generate delays upfront for each follower
-    delays = [(host, random.randint(MIN_DELAY, MAX_DELAY) / 1000.0) for host in FOLLOWER_HOSTS]
+    delays = [(host, ms / 1000.0) for host, ms in zip(FOLLOWER_HOSTS, random.choices(DELAY_RANGE_MS, k=len(FOLLOWER_HOSTS)))]
     
     async def replicate_with_delay(host: str, delay: float) -> Tuple[bool, float]:
         """Execute replication with pre-determined delay."""
@@ -95,16 +244,17 @@ async def replicate_to_followers(key: str, value: str, timestamp: float, quorum:
         try:
             response = await http_client.post(
                 f"http://{host}/replicate",
-                json={"key": key, "value": value, "timestamp": timestamp}
+                content=body,
+                headers=JSON_HEADERS
             )
             success = response.status_code == 200
             if success:
-                logger.info(f"Replicated to {host} (delay: {delay*1000:.0f}ms)")
+                logger.info("Replicated to %s (delay: %.0fms)", host, delay * 1000)
             else:
-                logger.warning(f"Failed to replicate to {host}: {response.status_code}")
+                logger.warning("Failed to replicate to %s: %s", host, response.status_code)
             return success, delay
         except Exception as e:
-            logger.error(f"Error replicating to {host}: {e}")
+            logger.error("Error replicating to %s: %s", host, e)
             return False, delay
     
     # Create tasks for all followers - they run truly concurrently
@@ -112,35 +262,47 @@ async def replicate_to_followers(key: str, value: str, timestamp: float, quorum:
         asyncio.create_task(replicate_with_delay(host, delay))
         for host, delay in delays
     ]
+    track_in_flight(tasks)
+    return await wait_for_quorum(tasks, quorum)
+
+async def wait_for_quorum(tasks: List[asyncio.Future], quorum: int) -> int:
+    """
+    Wait until quorum tasks report success (or all finish), leaving the rest to complete in background.
+    Returns the number of successful confirmations.
+    """
+    if quorum <= 0:
+        # Fully asynchronous replication: the tasks are already running, don't wait for any
+        return 0
+    if quorum >= len(tasks):
+        # Fully synchronous: every task has to finish anyway, so a plain gather is enough
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return sum(1 for r in results if isinstance(r, tuple) and r[0])
     
-    # Wait for quorum confirmations using FIRST_COMPLETED
+    # Tally results from done-callbacks; the loop only wakes when a task finishes,
+    # with no per-wake set rebuilding or callback re-registration
     confirmations = 0
-    pending_tasks = set(tasks)
+    finished = 0
+    wake = asyncio.Event()
     
-    while pending_tasks and confirmations < quorum:
-        done, pending_tasks = await asyncio.wait(
-            pending_tasks,
-            return_when=asyncio.FIRST_COMPLETED
-        )
-        for task in done:
-            try:
-                success, delay = task.result()
-                if success:
-                    confirmations += 1
-                    logger.info(f"Confirmation {confirmations}/{quorum} (delay: {delay*1000:.0f}ms)")
-            except Exception as e:
-                logger.error(f"Task failed: {e}")
-    
-    # Let remaining tasks complete in background
-    if pending_tasks:
-        async def complete_remaining():
-            for task in pending_tasks:
-                try:
-                    await task
-                except Exception:
-                    pass
-        asyncio.create_task(complete_remaining())
+    def on_done(task: asyncio.Future):
+        nonlocal confirmations, finished
+        finished += 1
+        wake.set()
+        # Failures are logged by replication_done
+        if task.cancelled() or task.exception() is not None:
+            return
+        success, delay = task.result()
+        if success and confirmations < quorum:
+            confirmations += 1
+            logger.info("Confirmation %d/%d (delay: %.0fms)", confirmations, quorum, delay * 1000)
+    
+    for task in tasks:
+        task.add_done_callback(on_done)
+    while confirmations < quorum and finished < len(tasks):
+        await wake.wait()
+        wake.clear()
     
+    # Remaining tasks complete in background; replication_done retrieves their results
     return confirmations
 
 @app.post("/write", response_model=WriteResponse)
@@ -149,27 +311,37 @@ async def write(request: WriteRequest):
     Write a key-value pair to the store and replicate to followers.
     Uses semi-synchronous replication with configurable write quorum.
     """
-    timestamp = datetime.utcnow().timestamp()
+    # Read once so a concurrent /config change can't split this write across two quorums
+    quorum = WRITE_QUORUM
+    # Integer nanoseconds: no datetime object, and no float rounding between close writes
+    timestamp = time.time_ns()
     
-    # Write to leader first with timestamp for last-write-wins
-    async with store_lock:
-        if request.key in kv_store:
-            existing_value, existing_timestamp = kv_store[request.key]
-            if timestamp > existing_timestamp:
-                kv_store[request.key] = (request.value, timestamp)
-        else:
-            kv_store[request.key] = (request.value, timestamp)
+    # Start replicating right away so the local commit overlaps the follower round trips;
+    # followers apply by timestamp (last-write-wins), so ordering does not depend on it
+    replication = asyncio.create_task(
+        replicate_to_followers(request.key, request.value, timestamp, quorum)
+    )
+    
+    # Write to leader with timestamp for last-write-wins
+    async with rwlock.reader_lock, lock_for(request.key):
+        entry = kv_store.get(request.key)
+        if entry is None:
+            kv_store[request.key] = Entry(request.value, timestamp)
+            kv_values[request.key] = request.value
+        elif timestamp > entry.ts:
+            entry.value = request.value
+            entry.ts = timestamp
+            kv_values[request.key] = request.value
     
-    logger.info(f"Write to leader: {request.key}={request.value}")
+    logger.info("Write to leader: %s=%s", request.key, request.value)
     
-    # Replicate to followers
-    confirmations = await replicate_to_followers(request.key, request.value, timestamp, WRITE_QUORUM)
+    confirmations = await replication
     
-    success = confirmations >= WRITE_QUORUM
-    message = f"Replicated to {confirmations}/{len(FOLLOWER_HOSTS)} followers (quorum: {WRITE_QUORUM})"
+    success = confirmations >= quorum
+    message = f"Replicated to {confirmations}/{len(FOLLOWER_HOSTS)} followers (quorum: {quorum})"
     
     if not success:
-        logger.warning(f"Write quorum not met: {confirmations}/{WRITE_QUORUM}")
+        logger.warning("Write quorum not met: %d/%d", confirmations, quorum)
     
     return WriteResponse(
         success=success,
@@ -184,10 +356,10 @@ async def read(key: str):
     """
     Read a value from the store.
     """
-    async with store_lock:
-        if key in kv_store:
-            value, _ = kv_store[key]
-            return ReadResponse(key=key, value=value, found=True)
+    async with rwlock.reader_lock:
+        entry = kv_store.get(key)
+        if entry is not None:
+            return ReadResponse(key=key, value=entry.value, found=True)
         else:
             return ReadResponse(key=key, value=None, found=False)
 
@@ -196,7 +368,7 @@ async def get_keys():
     """
     Get all keys in the store.
     """
-    async with store_lock:
+    async with rwlock.reader_lock:
         return {"keys": list(kv_store.keys())}
 
 @app.get("/all")
@@ -204,10 +376,11 @@ async def get_all():
     """
     Get all key-value pairs in the store.
     """
-    async with store_lock:
-        # Return only values without timestamps for comparison
-        data = {k: v[0] for k, v in kv_store.items()}
-        return {"data": data}
+    async with rwlock.reader_lock:
+        # Return only values without timestamps for comparison. ORJSONResponse serializes
+        # immediately, so the live dict is encoded while the reader lock is still held.
+        # Building the response directly also skips FastAPI's encoder pass.
+        return ORJSONResponse({"data": kv_values})
 
 @app.get("/health")
 async def health():
@@ -223,18 +396,50 @@ async def health():
         "max_delay": MAX_DELAY
     }
 
+@app.get("/replication_status")
+async def replication_status():
+    """
+    Number of follower replications still in flight; 0 means every follower
+    has been sent every write accepted so far.
+    """
+    return {"in_flight": replication_in_flight}
+
+@app.post("/config")
+async def config(request: ConfigRequest):
+    """
+    Change the write quorum at runtime, without restarting the leader.
+    """
+    global WRITE_QUORUM
+    if WORKERS > 1:
+        # Only the worker handling this request would change; the others keep the old quorum
+        raise HTTPException(status_code=409, detail="write_quorum can't be changed at runtime with WORKERS > 1; set WRITE_QUORUM and restart")
+    if not 0 <= request.write_quorum <= len(FOLLOWER_HOSTS):
+        raise HTTPException(status_code=400, detail=f"write_quorum must be between 0 and {len(FOLLOWER_HOSTS)}")
+    WRITE_QUORUM = request.write_quorum
+    logger.info("Write quorum set to %d", WRITE_QUORUM)
+    return {"status": "updated", "write_quorum": WRITE_QUORUM}
+
 @app.delete("/clear")
 async def clear():
     """
     Clear all data from the store.
     """
-    async with store_lock:
+    async with rwlock.writer_lock:
         kv_store.clear()
+        kv_values.clear()
     return {"status": "cleared"}
 
 if __name__ == "__main__":
-    logger.info(f"Starting leader on port {PORT}")
-    logger.info(f"Write quorum: {WRITE_QUORUM}")
-    logger.info(f"Followers: {FOLLOWER_HOSTS}")
-    logger.info(f"Network delay range: [{MIN_DELAY}ms, {MAX_DELAY}ms]")
-    uvicorn.run(app, host="0.0.0.0", port=PORT)
+    logger.info("Starting leader on port %s", PORT)
+    logger.info("Write quorum: %s", WRITE_QUORUM)
+    logger.info("Followers: %s", FOLLOWER_HOSTS)
+    logger.info("Network delay range: [%sms, %sms]", MIN_DELAY, MAX_DELAY)
+    # uvloop has no Windows build; fall back to the stdlib loop there
+    try:
+        import uvloop  # noqa: F401
+        loop = "uvloop"
+    except ImportError:
+        loop = "asyncio"
+    # Multiple workers need an import string so each process can load the app itself
+    target = "leader:app" if WORKERS > 1 else app
+    uvicorn.run(target, host="0.0.0.0", port=PORT, loop=loop, http="httptools", workers=WORKERS)
@@ -2,20 +2,27 @@
 Performance Analysis for the Key-Value Store with Single-Leader Replication.
 
 This script:
-1. Makes ~100 writes (sequentially to properly measure quorum latency) on 10 keys
+1. Makes ~100 writes on 10 keys, CONCURRENCY at a time (1 = sequential), timing each one
 2. Plots write quorum (1-5) vs latency metrics (mean, median, p95, p99)
 3. Checks if replica data matches leader data
 """
 
 import asyncio
+import re
 import time
-import statistics
-import subprocess
 import sys
 import os
+import aiohttp
 import httpx
+import orjson
+import numpy as np
+import matplotlib
+# Headless runs (CI, containers, piped output) go straight to Agg instead of probing GUI backends
+if not sys.stdout.isatty() or (sys.platform.startswith("linux") and not os.environ.get("DISPLAY")):
+    matplotlib.use("Agg")
 import matplotlib.pyplot as plt
-from typing import Dict, List, Tuple
+from itertools import product
+from typing import Dict, Optional, Tuple
 
 # Configuration
 LEADER_URL = "http://localhost:8000"
@@ -27,116 +34,193 @@ FOLLOWER_URLS = [
     "http://localhost:8005",
 ]
 
+JSON_HEADERS = {"content-type": "application/json"}
+
+# Fallback quorum switching edits the compose file next to this script
+COMPOSE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "docker-compose.yml")
+_QUORUM_RE = re.compile(rb"(WRITE_QUORUM=)\d+")
+
 # Test parameters
 NUM_KEYS = 10
 WRITES_PER_KEY = 10  # Total writes = 100
+# Writes in flight at once. The default of 1 keeps writes sequential, so each sample isolates
+# the quorum's order-statistic wait. Higher values measure latency under load instead, and
+# queueing on the leader then flattens the differences between the lower quorums.
+CONCURRENCY = int(os.getenv("CONCURRENCY", "1"))
+# Client library for the timed writes: aiohttp (default) or httpx, to compare against earlier runs.
+# Health checks, clears and consistency reads always use the shared httpx client.
+WRITE_CLIENT = os.getenv("WRITE_CLIENT", "aiohttp")
+# Latency budget (mean, ms) per quorum pass. The run stops after the first pass over budget,
+# since higher quorums only get slower; the plot and tables cover the passes that ran. 0 = off.
+MAX_LATENCY_MS = float(os.getenv("MAX_LATENCY_MS", "0"))
+
+MAX_MISMATCHES_SHOWN = 3  # example mismatches printed per follower in the consistency check
+
+# Key names and (key, key_idx, write_idx) plan are the same for every quorum pass.
+# Keys are interleaved (key_0..key_9, key_0..key_9, ...), so with CONCURRENCY > 1
+# the writes in flight hit different keys instead of queueing on the same one.
+KEYS = tuple(f"key_{i}" for i in range(NUM_KEYS))
+WRITE_PLAN = tuple((KEYS[k], k, w) for w, k in product(range(WRITES_PER_KEY), range(NUM_KEYS)))
 
-async def wait_for_services(timeout: int = 60):
+async def wait_for_services(client: httpx.AsyncClient, timeout: int = 60):
     """Wait for all services to be healthy."""
-    start = time.time()
+    start = time.perf_counter()
     services = [LEADER_URL] + FOLLOWER_URLS
     
-    async with httpx.AsyncClient() as client:
-        while time.time() - start < timeout:
-            try:
-                healthy = True
-                for url in services:
-                    response = await client.get(f"{url}/health", timeout=2.0)
-                    if response.status_code != 200:
-                        healthy = False
-                        break
-                if healthy:
-                    print("All services are healthy!")
-                    return True
-            except Exception:
-                pass
-            await asyncio.sleep(1)
+    while time.perf_counter() - start < timeout:
+        # Probe every service at once, so one slow service doesn't serialize the rest
+        results = await asyncio.gather(
+            *[client.get(f"{url}/health", timeout=2.0) for url in services],
+            return_exceptions=True
+        )
+        if all(not isinstance(r, Exception) and r.status_code == 200 for r in results):
+            print("All services are healthy!")
+            return True
+        await asyncio.sleep(1)
     
     raise TimeoutError("Services did not become healthy in time")
 
-async def clear_all_stores():
+async def warm_up_connections(client: httpx.AsyncClient, session: Optional[aiohttp.ClientSession] = None):
+    """
+    Open pooled connections before timing starts: one per follower and one per
+    concurrent write slot to the leader (on the aiohttp session when writes use it).
+    The second round confirms they are reused.
+    """
+    async def session_get(url: str):
+        async with session.get(url) as response:
+            await response.read()
+    
+    for _ in range(2):
+        requests = [client.get(f"{url}/health", timeout=5.0) for url in FOLLOWER_URLS]
+        if session is not None:
+            requests += [session_get(f"{LEADER_URL}/health") for _ in range(CONCURRENCY)]
+        else:
+            requests += [client.get(f"{LEADER_URL}/health", timeout=5.0) for _ in range(CONCURRENCY)]
+        await asyncio.gather(*requests, return_exceptions=True)
+
+async def clear_all_stores(client: httpx.AsyncClient):
     """Clear data from leader and all followers."""
-    async with httpx.AsyncClient() as client:
-        await client.delete(f"{LEADER_URL}/clear", timeout=5.0)
-        for url in FOLLOWER_URLS:
-            try:
-                await client.delete(f"{url}/clear", timeout=5.0)
-            except Exception:
-                pass
-
-async def write_single(client: httpx.AsyncClient, key: str, value: str) -> Tuple[bool, float]:
+    # Clear all nodes concurrently; follower failures are ignored, leader failures are not
+    results = await asyncio.gather(
+        *[client.delete(f"{url}/clear", timeout=5.0) for url in [LEADER_URL] + FOLLOWER_URLS],
+        return_exceptions=True
+    )
+    if isinstance(results[0], Exception):
+        raise results[0]
+
+async def wait_for_replication(client: httpx.AsyncClient, timeout: float = 3.0, interval: float = 0.05):
+    """
+    Poll the leader until no follower replication is in flight (or timeout expires).
+    Falls back to sleeping the full timeout if the leader has no /replication_status.
+    """
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            response = await client.get(f"{LEADER_URL}/replication_status", timeout=2.0)
+        except httpx.HTTPError:
+            response = None
+        if response is None or response.status_code != 200:
+            await asyncio.sleep(max(0.0, deadline - time.perf_counter()))
+            return
+        if orjson.loads(response.content)["in_flight"] == 0:
+            return
+        await asyncio.sleep(interval)
+
+async def write_single(client: httpx.AsyncClient, body: bytes) -> Tuple[bool, float]:
     """
-    Perform a single write and return (success, latency).
+    Perform a single write of a pre-serialized JSON body and return (success, latency).
     """
-    start_time = time.time()
+    start_time = time.perf_counter()
     try:
         response = await client.post(
             f"{LEADER_URL}/write",
-            json={"key": key, "value": value},
+            content=body,
+            headers=JSON_HEADERS,
             timeout=30.0
         )
-        latency = time.time() - start_time
+        latency = time.perf_counter() - start_time
         
         if response.status_code == 200:
-            data = response.json()
+            data = orjson.loads(response.content)
             return data["success"], latency
         return False, latency
-    except Exception as e:
-        latency = time.time() - start_time
-        print(f"Error writing {key}: {e}")
+    except Exception:
+        # No print here: stdout writes mid-run would stall the loop and skew later samples.
+        # Failures are counted and reported once the pass finishes.
+        latency = time.perf_counter() - start_time
+        return False, latency
+
+async def write_single_aiohttp(session: aiohttp.ClientSession, body: bytes) -> Tuple[bool, float]:
+    """
+    Same as write_single, over an aiohttp session.
+    """
+    start_time = time.perf_counter()
+    try:
+        async with session.post(f"{LEADER_URL}/write", data=body, headers=JSON_HEADERS) as response:
+            payload = await response.read()
+        latency = time.perf_counter() - start_time
+        
+        if response.status == 200:
+            return orjson.loads(payload)["success"], latency
+        return False, latency
+    except Exception:
+        latency = time.perf_counter() - start_time
         return False, latency
 
-async def run_performance_test(write_quorum: int) -> List[float]:
+async def run_performance_test(client: httpx.AsyncClient, write_quorum: int,
+                               session: Optional[aiohttp.ClientSession] = None) -> np.ndarray:
     """
     Run performance test with a specific write quorum.
-    Runs writes SEQUENTIALLY to properly measure the effect of quorum on latency.
-    Returns list of latencies for successful writes.
+    Runs up to CONCURRENCY writes at a time, timing each one individually.
+    Writes go through session when given, otherwise through client.
+    Returns an array of latencies (seconds) for successful writes.
     """
     print(f"\n{'='*60}")
     print(f"Testing with WRITE_QUORUM = {write_quorum}")
     print(f"{'='*60}")
     
-    # Clear stores before test
-    await clear_all_stores()
-    
-    latencies = []
-    successful_writes = 0
-    failed_writes = 0
-    
-    # Generate all write operations
-    write_operations = []
-    for key_idx in range(NUM_KEYS):
-        for write_idx in range(WRITES_PER_KEY):
-            key = f"key_{key_idx}"
-            value = f"value_{key_idx}_{write_idx}_{write_quorum}"
-            write_operations.append((key, value))
-    
-    print(f"Total write operations: {len(write_operations)}")
-    
-    # Execute writes SEQUENTIALLY to properly measure individual latency
-    async with httpx.AsyncClient() as client:
-        for idx, (key, value) in enumerate(write_operations):
-            success, latency = await write_single(client, key, value)
-            if success:
-                successful_writes += 1
-                latencies.append(latency)
+    # Clear stores before test, then warm the pool so no sample pays for a new connection
+    await clear_all_stores(client)
+    await warm_up_connections(client, session)
+    
+    # Only the values depend on the quorum; keys come from the shared plan.
+    # Bodies are serialized here, once per write and before any clock starts
+    # (generator: each body is built as its write task is created, no intermediate list)
+    write_operations = (orjson.dumps({"key": key, "value": f"value_{k}_{w}_{write_quorum}"})
+                        for key, k, w in WRITE_PLAN)
+    total = len(WRITE_PLAN)
+    
+    print(f"Total write operations: {total}")
+    
+    # Preallocated sample buffers, filled by write index
+    all_latencies = np.empty(total, dtype=np.float64)
+    success_mask = np.empty(total, dtype=bool)
+    
+    # Execute writes with bounded concurrency; the semaphore hands out slots in submission order.
+    # Nothing is printed until the pass is done, so console I/O doesn't land in the samples.
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    
+    async def bounded_write(idx: int, body: bytes):
+        async with semaphore:
+            if session is not None:
+                result = await write_single_aiohttp(session, body)
             else:
-                failed_writes += 1
-            
-            # Progress indicator every 20 writes
-            if (idx + 1) % 20 == 0:
-                print(f"  Progress: {idx + 1}/{len(write_operations)} writes completed")
+                result = await write_single(client, body)
+            success_mask[idx], all_latencies[idx] = result
+    
+    await asyncio.gather(*[bounded_write(idx, body) for idx, body in enumerate(write_operations)])
+    latencies = all_latencies[success_mask]
     
-    print(f"Successful writes: {successful_writes}")
-    print(f"Failed writes: {failed_writes}")
-    if latencies:
-        print(f"Average latency: {statistics.mean(latencies)*1000:.2f} ms")
-        print(f"Min latency: {min(latencies)*1000:.2f} ms")
-        print(f"Max latency: {max(latencies)*1000:.2f} ms")
+    print(f"Successful writes: {len(latencies)}")
+    print(f"Failed writes: {total - len(latencies)}")
+    if len(latencies):
+        print(f"Average latency: {latencies.mean()*1000:.2f} ms")
+        print(f"Min latency: {latencies.min()*1000:.2f} ms")
+        print(f"Max latency: {latencies.max()*1000:.2f} ms")
     
     return latencies
 
-async def check_data_consistency() -> Dict[str, any]:
+async def check_data_consistency(client: httpx.AsyncClient) -> Dict[str, any]:
     """
     Check if the data in replicas matches the data on the leader.
     Returns a dictionary with consistency analysis.
@@ -147,56 +231,54 @@ async def check_data_consistency() -> Dict[str, any]:
     
     # Wait for async replication to complete
     print("Waiting for async replication to complete...")
-    await asyncio.sleep(3)
+    await wait_for_replication(client)
     
-    async with httpx.AsyncClient() as client:
-        # Get leader data
-        response = await client.get(f"{LEADER_URL}/all")
-        leader_data = response.json()["data"]
+    # Fetch the leader and all followers concurrently
+    responses = await asyncio.gather(
+        *[client.get(f"{url}/all") for url in [LEADER_URL] + FOLLOWER_URLS]
+    )
+    # orjson parses the raw bytes directly, without httpx's text decode + json.loads
+    leader_data = orjson.loads(responses[0].content)["data"]
+    
+    # Built once and reused for every follower comparison
+    leader_keys = frozenset(leader_data)
+    
+    print(f"\nLeader has {len(leader_data)} keys")
+    
+    consistency_results = {
+        "leader_keys": len(leader_data),
+        "followers": {}
+    }
+    
+    # Compare with each follower
+    for i, response in enumerate(responses[1:]):
+        follower_name = f"follower{i+1}"
+        follower_data = orjson.loads(response.content)["data"]
         
-        print(f"\nLeader has {len(leader_data)} keys")
+        # Count matches and mismatches with set algebra on the key views
+        follower_keys = follower_data.keys()
+        common = leader_keys & follower_keys
+        mismatched = [key for key in common if leader_data[key] != follower_data[key]]
+        # Show a few examples per follower rather than every mismatched key
+        for key in mismatched[:MAX_MISMATCHES_SHOWN]:
+            print(f"  {follower_name}: Key '{key}' mismatch - Leader: '{leader_data[key]}', Follower: '{follower_data[key]}'")
+        if len(mismatched) > MAX_MISMATCHES_SHOWN:
+            print(f"  {follower_name}: ... and {len(mismatched) - MAX_MISMATCHES_SHOWN} more mismatched keys")
+        mismatched_keys = len(mismatched)
+        matching_keys = len(common) - mismatched_keys
+        missing_keys = len(leader_keys - follower_keys)
+        extra_keys = len(follower_keys - leader_keys)
         
-        consistency_results = {
-            "leader_keys": len(leader_data),
-            "followers": {}
+        consistency_results["followers"][follower_name] = {
+            "total_keys": len(follower_data),
+            "matching": matching_keys,
+            "mismatched": mismatched_keys,
+            "missing": missing_keys,
+            "extra": extra_keys
         }
         
-        # Compare with each follower
-        for i, url in enumerate(FOLLOWER_URLS):
-            follower_name = f"follower{i+1}"
-            response = await client.get(f"{url}/all")
-            follower_data = response.json()["data"]
-            
-            # Count matches and mismatches
-            matching_keys = 0
-            mismatched_keys = 0
-            missing_keys = 0
-            extra_keys = 0
-            
-            for key, value in leader_data.items():
-                if key in follower_data:
-                    if follower_data[key] == value:
-                        matching_keys += 1
-                    else:
-                        mismatched_keys += 1
-                        print(f"  {follower_name}: Key '{key}' mismatch - Leader: '{value}', Follower: '{follower_data[key]}'")
-                else:
-                    missing_keys += 1
-            
-            for key in follower_data:
-                if key not in leader_data:
-                    extra_keys += 1
-            
-            consistency_results["followers"][follower_name] = {
-                "total_keys": len(follower_data),
-                "matching": matching_keys,
-                "mismatched": mismatched_keys,
-                "missing": missing_keys,
-                "extra": extra_keys
-            }
-            
-            match_percentage = (matching_keys / len(leader_data) * 100) if leader_data else 100
-            print(f"{follower_name}: {len(follower_data)} keys, {matching_keys} matching ({match_percentage:.1f}%), {mismatched_keys} mismatched, {missing_keys} missing")
+        match_percentage = (matching_keys / len(leader_data) * 100) if leader_data else 100
+        print(f"{follower_name}: {len(follower_data)} keys, {matching_keys} matching ({match_percentage:.1f}%), {mismatched_keys} mismatched, {missing_keys} missing")
     
     return consistency_results
 
@@ -205,70 +287,88 @@ def update_write_quorum(quorum: int):
     Update the write quorum in the docker-compose.yml file.
     This requires restarting the leader container.
     """
-    import re
-    
-    with open("docker-compose.yml", "r") as f:
+    with open(COMPOSE_FILE, "rb") as f:
         content = f.read()
     
     # Update WRITE_QUORUM value
-    content = re.sub(
-        r'(WRITE_QUORUM=)\d+',
-        f'\\g<1>{quorum}',
-        content
-    )
+    content = _QUORUM_RE.sub(b"\\g<1>" + str(quorum).encode(), content)
     
-    with open("docker-compose.yml", "w") as f:
+    # Write a temp file and swap it in, so an interrupted run can't leave a truncated compose file
+    tmp_path = COMPOSE_FILE + ".tmp"
+    with open(tmp_path, "wb") as f:
         f.write(content)
+    os.replace(tmp_path, COMPOSE_FILE)
+
+async def set_write_quorum(client: httpx.AsyncClient, quorum: int):
+    """
+    Switch the leader's write quorum through its /config endpoint.
+    Falls back to editing docker-compose.yml and recreating the container
+    if the running leader doesn't support runtime configuration.
+    """
+    try:
+        response = await client.post(f"{LEADER_URL}/config", json={"write_quorum": quorum}, timeout=5.0)
+        if response.status_code == 200:
+            return
+        print(f"Leader rejected /config ({response.status_code}), recreating container instead")
+    except httpx.HTTPError as e:
+        print(f"Leader /config unavailable ({e}), recreating container instead")
+    update_write_quorum(quorum)
+    await restart_leader(client)
 
-async def restart_leader():
+async def restart_leader(client: httpx.AsyncClient):
     """Restart the leader container to apply new configuration."""
     print("Restarting leader container...")
     cwd = os.path.dirname(os.path.abspath(__file__)) or "."
     # Use up -d --force-recreate to reload environment variables from docker-compose.yml
     # docker-compose restart doesn't reload env vars, it just restarts the same container
-    subprocess.run(["docker-compose", "up", "-d", "--force-recreate", "leader"], 
-                   capture_output=True, 
-                   cwd=cwd)
-    await asyncio.sleep(5)  # Wait for leader to restart
-    await wait_for_services(timeout=30)
-
-def calculate_percentile(data: List[float], percentile: float) -> float:
-    """Calculate the given percentile of a list of values."""
-    sorted_data = sorted(data)
-    index = (percentile / 100) * (len(sorted_data) - 1)
-    lower = int(index)
-    upper = lower + 1
-    if upper >= len(sorted_data):
-        return sorted_data[-1]
-    weight = index - lower
-    return sorted_data[lower] * (1 - weight) + sorted_data[upper] * weight
-
-def plot_results(quorum_latencies: Dict[int, List[float]]):
+    # Async exec keeps the event loop (and the client's pool housekeeping) live during the recreate
+    proc = await asyncio.create_subprocess_exec(
+        "docker-compose", "up", "-d", "--force-recreate", "leader",
+        cwd=cwd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    await proc.communicate()
+    # wait_for_services polls /health, so no fixed sleep is needed for the restart
+    await wait_for_services(client, timeout=30)
+
+def summarize(latencies: np.ndarray) -> Dict[str, float]:
+    """Return mean, sample std dev, median, p95, p99 and sample count of a list of latencies."""
+    arr = np.asarray(latencies, dtype=np.float64)  # no copy for the float64 arrays from run_performance_test
+    median, p95, p99 = np.percentile(arr, [50, 95, 99])
+    std = float(arr.std(ddof=1)) if len(arr) > 1 else 0.0
+    return {"mean": float(arr.mean()), "std": std, "median": float(median), "p95": float(p95), "p99": float(p99), "n": len(arr)}
+
+# (label, color, marker) for the mean/median/p95/p99 lines, in plotting order
+PLOT_SERIES = [
+    ('Mean', 'blue', 'o'),
+    ('Median', 'green', 's'),
+    ('P95', 'orange', '^'),
+    ('P99', 'red', 'd'),
+]
+
+def plot_results(summaries: Dict[int, Dict[str, float]]):
     """
     Plot write quorum vs latency metrics (mean, median, p95, p99).
     X-axis: all 5 quorum values (1-5)
     Y-axis: 0 to 1.0 seconds
     Lines: mean, median, p95, p99
     """
-    quorums = sorted(quorum_latencies.keys())
-    
-    # Calculate metrics for each quorum (in seconds)
-    means = [statistics.mean(quorum_latencies[q]) for q in quorums]
-    medians = [statistics.median(quorum_latencies[q]) for q in quorums]
-    p95s = [calculate_percentile(quorum_latencies[q], 95) for q in quorums]
-    p99s = [calculate_percentile(quorum_latencies[q], 99) for q in quorums]
-    
-    plt.figure(figsize=(10, 6))
-    
-    # Plot all 4 lines
-    plt.plot(quorums, means, marker='o', linewidth=2, markersize=8, 
-             color='blue', label='Mean')
-    plt.plot(quorums, medians, marker='s', linewidth=2, markersize=8, 
-             color='green', label='Median')
-    plt.plot(quorums, p95s, marker='^', linewidth=2, markersize=8, 
-             color='orange', label='P95')
-    plt.plot(quorums, p99s, marker='d', linewidth=2, markersize=8, 
-             color='red', label='P99')
+    quorums = sorted(summaries.keys())
+    
+    # Metrics for each quorum (in seconds)
+    means = [summaries[q]["mean"] for q in quorums]
+    medians = [summaries[q]["median"] for q in quorums]
+    p95s = [summaries[q]["p95"] for q in quorums]
+    p99s = [summaries[q]["p99"] for q in quorums]
+    
+    fig = plt.figure(figsize=(10, 6))
+    
+    # Plot all 4 lines in one call (one column per metric), then style each line
+    metrics = np.stack([means, medians, p95s, p99s])
+    lines = plt.plot(quorums, metrics.T, linewidth=2, markersize=8)
+    for line, (label, color, marker) in zip(lines, PLOT_SERIES):
+        line.set(label=label, color=color, marker=marker)
     
     plt.xlabel('Write Quorum', fontsize=12)
     plt.ylabel('Write Latency (seconds)', fontsize=12)
@@ -289,9 +389,12 @@ def plot_results(quorum_latencies: Dict[int, List[float]]):
     plt.tight_layout()
     plt.savefig('latency_vs_quorum.png', dpi=150)
     print("\nPlot saved as 'latency_vs_quorum.png'")
-    plt.show()
+    # Agg (selected at import for headless runs) can't show a window
+    if plt.get_backend().lower() != "agg":
+        plt.show()
+    plt.close(fig)
 
-def print_analysis(quorum_latencies: Dict[int, List[float]], consistency_results: Dict):
+def print_analysis(quorum_latencies: Dict[int, np.ndarray], consistency_results: Dict):
     """
     Print analysis and explanation of results.
     """
@@ -390,32 +493,65 @@ async def main():
     print("PERFORMANCE ANALYSIS: Key-Value Store with Leader Replication")
     print("="*60)
     
-    # Always test all 5 quorum values for complete graph
+    # Test all 5 quorum values for a complete graph, unless MAX_LATENCY_MS cuts the run short
     quorum_values = [1, 2, 3, 4, 5]
     
+    # One pooled client for the whole run, so requests reuse keep-alive connections.
+    # keepalive_expiry keeps idle follower sockets open across the leader restarts between passes,
+    # and the pool grows with CONCURRENCY so every in-flight write can keep its own socket.
+    client = httpx.AsyncClient(
+        # Limits go on the transport: httpx ignores the client's limits= when transport= is given
+        # retries only re-attempts failed connects (e.g. right after a fallback leader recreate),
+        # so the same client and pool carry on across all quorum passes
+        transport=httpx.AsyncHTTPTransport(
+            retries=1,
+            limits=httpx.Limits(
+                max_connections=max(128, CONCURRENCY * 2),
+                max_keepalive_connections=max(64, CONCURRENCY * 2),
+                keepalive_expiry=60.0
+            )
+        ),
+        headers={"Connection": "keep-alive"},
+        # Fail fast on a dead host instead of holding a write slot for the full 30s
+        timeout=httpx.Timeout(30.0, connect=5.0)
+    )
+    session = None
+    if WRITE_CLIENT == "aiohttp":
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=max(32, CONCURRENCY * 2), ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=30)
+        )
+    print(f"Timed writes use {'aiohttp' if session is not None else 'httpx'}")
     try:
         # Wait for services to be ready
         print("\nWaiting for services to be ready...")
-        await wait_for_services()
+        await wait_for_services(client)
         
         quorum_latencies = {}
         
         for quorum in quorum_values:
-            # Update configuration and restart leader
+            # Update configuration (no container restart needed)
             print(f"\nConfiguring write quorum = {quorum}...")
-            update_write_quorum(quorum)
-            await restart_leader()
+            await set_write_quorum(client, quorum)
             
             # Run performance test
-            latencies = await run_performance_test(quorum)
+            latencies = await run_performance_test(client, quorum, session)
             quorum_latencies[quorum] = latencies
+            
+            if MAX_LATENCY_MS and len(latencies) and latencies.mean() * 1000 > MAX_LATENCY_MS:
+                print(f"\nMean latency {latencies.mean() * 1000:.1f}ms exceeds MAX_LATENCY_MS={MAX_LATENCY_MS:g}, "
+                      f"skipping quorums above {quorum}")
+                break
         
         # Check data consistency after all tests
-        consistency_results = await check_data_consistency()
+        consistency_results = await check_data_consistency(client)
+        
+        # Summarize each quorum once; the plot and the summary table share the numbers
+        summaries = {q: summarize(quorum_latencies[q]) for q in quorum_latencies}
         
         # Plot results
         print("\nGenerating plot...")
-        plot_results(quorum_latencies)
+        plot_results(summaries)
         
         # Print analysis
         print_analysis(quorum_latencies, consistency_results)
@@ -424,20 +560,26 @@ async def main():
         print("\n" + "="*60)
         print("SUMMARY STATISTICS")
         print("="*60)
-        print(f"{'Quorum':<8} {'Mean':<12} {'Median':<12} {'P95':<12} {'P99':<12} {'Count':<8}")
-        print("-" * 64)
-        for quorum in sorted(quorum_latencies.keys()):
-            latencies = quorum_latencies[quorum]
-            mean_val = statistics.mean(latencies)
-            median_val = statistics.median(latencies)
-            p95_val = calculate_percentile(latencies, 95)
-            p99_val = calculate_percentile(latencies, 99)
-            print(f"{quorum:<8} {mean_val:.3f}s{'':<6} {median_val:.3f}s{'':<6} {p95_val:.3f}s{'':<6} {p99_val:.3f}s{'':<6} {len(latencies):<8}")
+        print(f"{'Quorum':<8} {'Mean':<12} {'StdDev':<12} {'Median':<12} {'P95':<12} {'P99':<12} {'Count':<8}")
+        print("-" * 77)
+        for quorum in sorted(summaries.keys()):
+            summary = summaries[quorum]
+            print(f"{quorum:<8} {summary['mean']:.3f}s{'':<6} {summary['std']:.3f}s{'':<6} {summary['median']:.3f}s{'':<6} {summary['p95']:.3f}s{'':<6} {summary['p99']:.3f}s{'':<6} {summary['n']:<8}")
         
     except Exception as e:
         print(f"Error during performance analysis: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        await client.aclose()
+        if session is not None:
+            await session.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # uvloop trims per-request loop overhead from every latency sample; it has no Windows build
+    try:
+        import uvloop
+    except ImportError:
+        asyncio.run(main())
+    else:
+        uvloop.run(main())
@@ -6,6 +6,7 @@ Tests the basic functionality, replication, and consistency.
 import asyncio
 import time
 import pytest
+import pytest_asyncio
 import httpx
 
 # Configuration
@@ -18,261 +19,277 @@ FOLLOWER_URLS = [
     "http://localhost:8005",
 ]
 
-async def wait_for_services(timeout: int = 60):
+async def wait_for_services(client: httpx.AsyncClient, timeout: int = 60):
     """Wait for all services to be healthy."""
-    start = time.time()
+    start = time.monotonic()
     services = [LEADER_URL] + FOLLOWER_URLS
     
-    async with httpx.AsyncClient() as client:
-        while time.time() - start < timeout:
-            try:
-                healthy = True
-                for url in services:
-                    response = await client.get(f"{url}/health", timeout=2.0)
-                    if response.status_code != 200:
-                        healthy = False
-                        break
-                if healthy:
-                    print("All services are healthy!")
-                    return True
-            except Exception:
-                pass
-            await asyncio.sleep(1)
+    while time.monotonic() - start < timeout:
+        # Probe every service at once, so one slow service doesn't serialize the rest
+        results = await asyncio.gather(
+            *[client.get(f"{url}/health", timeout=2.0) for url in services],
+            return_exceptions=True
+        )
+        if all(not isinstance(r, Exception) and r.status_code == 200 for r in results):
+            print("All services are healthy!")
+            return True
+        await asyncio.sleep(1)
     
     raise TimeoutError("Services did not become healthy in time")
 
-async def clear_all_stores():
+async def clear_all_stores(client: httpx.AsyncClient):
     """Clear data from leader and all followers."""
-    async with httpx.AsyncClient() as client:
-        await client.delete(f"{LEADER_URL}/clear", timeout=5.0)
-        for url in FOLLOWER_URLS:
-            try:
-                await client.delete(f"{url}/clear", timeout=5.0)
-            except Exception:
-                pass
+    # Clear all nodes concurrently; follower failures are ignored, leader failures are not
+    results = await asyncio.gather(
+        *[client.delete(f"{url}/clear", timeout=5.0) for url in [LEADER_URL] + FOLLOWER_URLS],
+        return_exceptions=True
+    )
+    if isinstance(results[0], Exception):
+        raise results[0]
+
+async def wait_until(pred, timeout: float, interval: float = 0.05) -> bool:
+    """Await pred() every interval until it returns True; False if timeout expires first."""
+    deadline = time.monotonic() + timeout
+    while True:
+        if await pred():
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(interval)
+
+async def count_followers_with(client: httpx.AsyncClient, key: str, value: str) -> int:
+    """Number of followers currently holding key=value."""
+    responses = await asyncio.gather(
+        *[client.get(f"{url}/read/{key}") for url in FOLLOWER_URLS],
+        return_exceptions=True
+    )
+    found_count = 0
+    for response in responses:
+        if not isinstance(response, Exception) and response.status_code == 200:
+            data = response.json()
+            if data["found"] and data["value"] == value:
+                found_count += 1
+    return found_count
 
 @pytest.fixture(scope="module")
 def event_loop():
-    """Create an instance of the default event loop for the test session."""
-    loop = asyncio.new_event_loop()
+    """Create an event loop for the test module (uvloop when installed)."""
+    try:
+        import uvloop
+    except ImportError:  # no uvloop build on Windows
+        loop = asyncio.new_event_loop()
+    else:
+        loop = uvloop.new_event_loop()
     yield loop
     loop.close()
 
-@pytest.fixture(scope="module", autouse=True)
-async def setup_services():
+@pytest_asyncio.fixture(scope="module")
+async def client():
+    """One pooled client shared by every test in the module."""
+    async with httpx.AsyncClient(timeout=15.0) as c:
+        yield c
+
+@pytest_asyncio.fixture(scope="module", autouse=True)
+async def setup_services(client):
     """Setup fixture to wait for services."""
-    await wait_for_services()
+    await wait_for_services(client)
     yield
     # Cleanup after tests
-    await clear_all_stores()
+    await clear_all_stores(client)
+
+@pytest_asyncio.fixture
+async def clean_store(client):
+    """Start the test from empty stores on every node."""
+    await clear_all_stores(client)
 
 @pytest.mark.asyncio
-async def test_leader_health():
+async def test_leader_health(client):
     """Test that the leader is healthy."""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(f"{LEADER_URL}/health")
-        assert response.status_code == 200
-        data = response.json()
-        assert data["status"] == "healthy"
-        assert data["role"] == "leader"
+    response = await client.get(f"{LEADER_URL}/health")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "healthy"
+    assert data["role"] == "leader"
 
 @pytest.mark.asyncio
-async def test_follower_health():
+async def test_follower_health(client):
     """Test that all followers are healthy."""
-    async with httpx.AsyncClient() as client:
-        for i, url in enumerate(FOLLOWER_URLS):
-            response = await client.get(f"{url}/health")
-            assert response.status_code == 200
-            data = response.json()
-            assert data["status"] == "healthy"
-            assert data["role"] == "follower"
+    for i, url in enumerate(FOLLOWER_URLS):
+        response = await client.get(f"{url}/health")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["status"] == "healthy"
+        assert data["role"] == "follower"
 
 @pytest.mark.asyncio
-async def test_write_and_read_from_leader():
+async def test_write_and_read_from_leader(client, clean_store):
     """Test basic write and read operations on the leader."""
-    await clear_all_stores()
+    # Write a value
+    response = await client.post(
+        f"{LEADER_URL}/write",
+        json={"key": "test_key", "value": "test_value"},
+        timeout=15.0
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["success"] == True
+    assert data["key"] == "test_key"
+    assert data["value"] == "test_value"
     
-    async with httpx.AsyncClient() as client:
-        # Write a value
-        response = await client.post(
-            f"{LEADER_URL}/write",
-            json={"key": "test_key", "value": "test_value"},
-            timeout=15.0
-        )
-        assert response.status_code == 200
-        data = response.json()
-        assert data["success"] == True
-        assert data["key"] == "test_key"
-        assert data["value"] == "test_value"
-        
-        # Read the value back
-        response = await client.get(f"{LEADER_URL}/read/test_key")
-        assert response.status_code == 200
-        data = response.json()
-        assert data["found"] == True
-        assert data["value"] == "test_value"
+    # Read the value back
+    response = await client.get(f"{LEADER_URL}/read/test_key")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["found"] == True
+    assert data["value"] == "test_value"
 
 @pytest.mark.asyncio
-async def test_replication_to_followers():
+async def test_replication_to_followers(client, clean_store):
     """Test that writes are replicated to followers."""
-    await clear_all_stores()
+    # Write a value to the leader
+    response = await client.post(
+        f"{LEADER_URL}/write",
+        json={"key": "replicated_key", "value": "replicated_value"},
+        timeout=15.0
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["success"] == True
     
-    async with httpx.AsyncClient() as client:
-        # Write a value to the leader
-        response = await client.post(
+    # Poll until replication reaches the followers (up to 2s)
+    async def replicated():
+        return await count_followers_with(client, "replicated_key", "replicated_value") >= 2
+    await wait_until(replicated, timeout=2)
+    
+    # Check that the value is on at least one follower
+    found_count = await count_followers_with(client, "replicated_key", "replicated_value")
+    
+    # With quorum=2, we expect at least 2 followers to have the data
+    assert found_count >= 2, f"Expected at least 2 followers to have data, but found {found_count}"
+
+@pytest.mark.asyncio
+async def test_concurrent_writes(client, clean_store):
+    """Test that concurrent writes work correctly."""
+    # Perform multiple concurrent writes
+    tasks = []
+    for i in range(10):
+        task = client.post(
             f"{LEADER_URL}/write",
-            json={"key": "replicated_key", "value": "replicated_value"},
+            json={"key": f"concurrent_key_{i}", "value": f"value_{i}"},
             timeout=15.0
         )
+        tasks.append(task)
+    
+    responses = await asyncio.gather(*tasks)
+    
+    # All writes should succeed
+    for response in responses:
         assert response.status_code == 200
         data = response.json()
         assert data["success"] == True
-        
-        # Wait a bit for replication to complete
-        await asyncio.sleep(2)
-        
-        # Check that the value is on at least one follower
-        found_count = 0
-        for url in FOLLOWER_URLS:
-            response = await client.get(f"{url}/read/replicated_key")
-            if response.status_code == 200:
-                data = response.json()
-                if data["found"] and data["value"] == "replicated_value":
-                    found_count += 1
-        
-        # With quorum=2, we expect at least 2 followers to have the data
-        assert found_count >= 2, f"Expected at least 2 followers to have data, but found {found_count}"
-
-@pytest.mark.asyncio
-async def test_concurrent_writes():
-    """Test that concurrent writes work correctly."""
-    await clear_all_stores()
     
-    async with httpx.AsyncClient() as client:
-        # Perform multiple concurrent writes
-        tasks = []
-        for i in range(10):
-            task = client.post(
-                f"{LEADER_URL}/write",
-                json={"key": f"concurrent_key_{i}", "value": f"value_{i}"},
-                timeout=15.0
-            )
-            tasks.append(task)
-        
-        responses = await asyncio.gather(*tasks)
-        
-        # All writes should succeed
-        for response in responses:
-            assert response.status_code == 200
-            data = response.json()
-            assert data["success"] == True
-        
-        # Verify all keys are on the leader
-        for i in range(10):
-            response = await client.get(f"{LEADER_URL}/read/concurrent_key_{i}")
-            assert response.status_code == 200
-            data = response.json()
-            assert data["found"] == True
-            assert data["value"] == f"value_{i}"
+    # Verify all keys are on the leader
+    for i in range(10):
+        response = await client.get(f"{LEADER_URL}/read/concurrent_key_{i}")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["found"] == True
+        assert data["value"] == f"value_{i}"
 
 @pytest.mark.asyncio
-async def test_read_non_existent_key():
+async def test_read_non_existent_key(client, clean_store):
     """Test reading a non-existent key."""
-    await clear_all_stores()
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.get(f"{LEADER_URL}/read/non_existent_key")
-        assert response.status_code == 200
-        data = response.json()
-        assert data["found"] == False
-        assert data["value"] is None
+    response = await client.get(f"{LEADER_URL}/read/non_existent_key")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["found"] == False
+    assert data["value"] is None
 
 @pytest.mark.asyncio
-async def test_overwrite_key():
+async def test_overwrite_key(client, clean_store):
     """Test that overwriting a key works correctly."""
-    await clear_all_stores()
+    # Write initial value
+    response = await client.post(
+        f"{LEADER_URL}/write",
+        json={"key": "overwrite_key", "value": "initial_value"},
+        timeout=15.0
+    )
+    assert response.status_code == 200
     
-    async with httpx.AsyncClient() as client:
-        # Write initial value
-        response = await client.post(
+    # Wait for replication (up to 1s)
+    async def replicated():
+        return await count_followers_with(client, "overwrite_key", "initial_value") == len(FOLLOWER_URLS)
+    await wait_until(replicated, timeout=1)
+    
+    # Overwrite with new value
+    response = await client.post(
+        f"{LEADER_URL}/write",
+        json={"key": "overwrite_key", "value": "updated_value"},
+        timeout=15.0
+    )
+    assert response.status_code == 200
+    
+    # Verify the new value on leader
+    response = await client.get(f"{LEADER_URL}/read/overwrite_key")
+    data = response.json()
+    assert data["value"] == "updated_value"
+
+@pytest.mark.asyncio
+async def test_get_all_keys(client, clean_store):
+    """Test getting all keys from the store."""
+    # Write some keys
+    for i in range(5):
+        await client.post(
             f"{LEADER_URL}/write",
-            json={"key": "overwrite_key", "value": "initial_value"},
+            json={"key": f"all_keys_{i}", "value": f"value_{i}"},
             timeout=15.0
         )
-        assert response.status_code == 200
-        
-        # Wait for replication
-        await asyncio.sleep(1)
-        
-        # Overwrite with new value
+    
+    # Get all keys
+    response = await client.get(f"{LEADER_URL}/keys")
+    assert response.status_code == 200
+    data = response.json()
+    
+    for i in range(5):
+        assert f"all_keys_{i}" in data["keys"]
+
+@pytest.mark.asyncio
+async def test_eventual_consistency(client, clean_store):
+    """Test that all replicas eventually have the same data."""
+    # Write several values
+    for i in range(5):
         response = await client.post(
             f"{LEADER_URL}/write",
-            json={"key": "overwrite_key", "value": "updated_value"},
+            json={"key": f"consistency_key_{i}", "value": f"value_{i}"},
             timeout=15.0
         )
         assert response.status_code == 200
-        
-        # Verify the new value on leader
-        response = await client.get(f"{LEADER_URL}/read/overwrite_key")
-        data = response.json()
-        assert data["value"] == "updated_value"
-
-@pytest.mark.asyncio
-async def test_get_all_keys():
-    """Test getting all keys from the store."""
-    await clear_all_stores()
     
-    async with httpx.AsyncClient() as client:
-        # Write some keys
-        for i in range(5):
-            await client.post(
-                f"{LEADER_URL}/write",
-                json={"key": f"all_keys_{i}", "value": f"value_{i}"},
-                timeout=15.0
-            )
-        
-        # Get all keys
-        response = await client.get(f"{LEADER_URL}/keys")
-        assert response.status_code == 200
-        data = response.json()
-        
-        for i in range(5):
-            assert f"all_keys_{i}" in data["keys"]
-
-@pytest.mark.asyncio
-async def test_eventual_consistency():
-    """Test that all replicas eventually have the same data."""
-    await clear_all_stores()
+    # Wait for full replication (account for max delay), stopping as soon as every follower has all keys
+    async def replicated():
+        counts = await asyncio.gather(
+            *[count_followers_with(client, f"consistency_key_{i}", f"value_{i}") for i in range(5)]
+        )
+        return all(count == len(FOLLOWER_URLS) for count in counts)
+    await wait_until(replicated, timeout=3)
     
-    async with httpx.AsyncClient() as client:
-        # Write several values
-        for i in range(5):
-            response = await client.post(
-                f"{LEADER_URL}/write",
-                json={"key": f"consistency_key_{i}", "value": f"value_{i}"},
-                timeout=15.0
-            )
-            assert response.status_code == 200
-        
-        # Wait for full replication (account for max delay)
-        await asyncio.sleep(3)
-        
-        # Get data from leader
-        response = await client.get(f"{LEADER_URL}/all")
-        leader_data = response.json()["data"]
+    # Get data from the leader and every follower concurrently
+    responses = await asyncio.gather(
+        *[client.get(f"{url}/all") for url in [LEADER_URL] + FOLLOWER_URLS]
+    )
+    leader_data = responses[0].json()["data"]
+    
+    # Check each follower
+    for url, response in zip(FOLLOWER_URLS, responses[1:]):
+        follower_data = response.json()["data"]
         
-        # Check each follower
-        for url in FOLLOWER_URLS:
-            response = await client.get(f"{url}/all")
-            follower_data = response.json()["data"]
-            
-            # Each follower should have at least the keys we wrote
-            # (may have more or less depending on timing)
-            for key, value in leader_data.items():
-                if key.startswith("consistency_key_"):
-                    if key in follower_data:
-                        assert follower_data[key] == value, \
-                            f"Follower {url} has wrong value for {key}"
+        # Each follower should have at least the keys we wrote
+        # (may have more or less depending on timing); compare only keys both sides have
+        common = leader_data.keys() & follower_data.keys()
+        for key in common:
+            if key.startswith("consistency_key_"):
+                assert follower_data[key] == leader_data[key], \
+                    f"Follower {url} has wrong value for {key}"
 
 if __name__ == "__main__":
     # Run tests